@@ -6,13 +6,15 @@ from chess.agent import (
     MinimaxAgent,
     RandomAgent,
 )
+from chess.bitboard import BitBoard
+from chess.cache import LRUCache
 from chess.chess import Chess
 from chess.chessboard import ChessBoard
 from chess.constant import Color, Name, Winner
 from chess.database import Database
 from chess.evaluate import Evaluate, QuantumValueTable, RelativeStrength, ValueTable
 from chess.game import Game
-from chess.piece import Piece
+from chess.piece import Piece, PieceList
 from chess.rule import ActionRule, MoveRule, Rule, SpecialMoveRule
 from chess.settings import setting
 
@@ -23,6 +25,7 @@ __all__ = [
     "HumanAgent",
     "MinimaxAgent",
     "RandomAgent",
+    "BitBoard",
     "Chess",
     "ChessBoard",
     "Color",
@@ -34,7 +37,9 @@ __all__ = [
     "RelativeStrength",
     "ValueTable",
     "Game",
+    "LRUCache",
     "Piece",
+    "PieceList",
     "ActionRule",
     "MoveRule",
     "Rule",
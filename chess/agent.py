@@ -5,6 +5,7 @@
 
 import abc
 import random
+from array import array
 from collections import OrderedDict
 from typing import Callable, List, Optional, Tuple, Union
 
@@ -83,9 +84,10 @@ class GreedyAgent(Agent):
     def run(self, chessboard: ChessBoard) -> str:
         # Sort actions by value
         actions = []
-        for source, target in chessboard.actions():
-            val = chessboard.copy().move_piece(source, target).evaluate(self.evaluate)
-            actions.append((val, source, target))
+        for action in chessboard.actions(encoded=True):
+            val = chessboard.push(action).evaluate(self.evaluate)
+            chessboard.pop()
+            actions.append((val, action))
         actions.sort()
 
         # The white side should maximize the value
@@ -101,7 +103,7 @@ class GreedyAgent(Agent):
         action = random.choice(
             [action for action in actions if abs(action[0] - extremum) < 1e-6]
         )
-        chessboard.move_piece(*action[1:])
+        chessboard.move_piece(action[1])
         return chessboard.record
 
 
@@ -131,7 +133,9 @@ class MinimaxAgent(Agent):
         data["deepth"] = self.deepth
         return data
 
-    def minimax(self, deepth: int, chessboard: ChessBoard) -> List[float]:
+    def minimax(
+        self, deepth: int, chessboard: ChessBoard, actions: Optional[array] = None
+    ) -> List[float]:
         """
         Minimax algorithm.
 
@@ -140,33 +144,41 @@ class MinimaxAgent(Agent):
         deepth : int
             Remaining maximum depth (for recursive calls).
         chessboard : ChessBoard
-            Current chessboard (a copy of the original chessboard).
+            Current chessboard. It is unchanged after the call.
+        actions : array, optional
+            The packed actions of the chessboard to be valued, in this order.
+            Defaults to `chessboard.actions(encoded=True)`.
 
         """
+        color = chessboard.color
+        if actions is None:
+            actions = chessboard.actions(encoded=True)
+
         # Constantly maximize the minimum value (for white)
         # or minimize the maximum value (for black)
         if deepth > 0:
             values = []
-            for source, target in chessboard.actions():
-                new_chessboard = chessboard.copy().move_piece(source, target)
-                if chessboard.color == Color.WHITE:
-                    value = min(self.minimax(deepth - 1, new_chessboard))
+            for action in actions:
+                chessboard.push(action)
+                if color == Color.WHITE:
+                    value = min(self.minimax(deepth - 1, chessboard))
                 else:
-                    value = max(self.minimax(deepth - 1, new_chessboard))
+                    value = max(self.minimax(deepth - 1, chessboard))
+                chessboard.pop()
                 values.append(value)
 
         # For the last layer, return directly to the value of action
         else:
-            values = [
-                chessboard.copy().move_piece(source, target).evaluate(self.evaluate)
-                for source, target in chessboard.actions()
-            ]
+            values = []
+            for action in actions:
+                values.append(chessboard.push(action).evaluate(self.evaluate))
+                chessboard.pop()
 
         # According to the rules of chess,
         # if there is no alternative action,
         # it will be judged negative directly
         if len(values) == 0:
-            if chessboard.color == Color.WHITE:
+            if color == Color.WHITE:
                 values.append(-float("inf"))
             else:
                 values.append(float("inf"))
@@ -174,16 +186,13 @@ class MinimaxAgent(Agent):
         return values
 
     def run(self, chessboard: ChessBoard) -> str:
-        # Calculate the value of each action
-        values = self.minimax(self.deepth, chessboard)
+        # Calculate the value of each action.
+        # The same list is used to match the values to the actions.
+        actions = chessboard.actions(encoded=True)
+        values = self.minimax(self.deepth, chessboard, actions)
 
         # Sort and choose the best action
-        actions = sorted(
-            [
-                (values[index], *action)
-                for index, action in enumerate(chessboard.actions())
-            ]
-        )
+        actions = sorted(zip(values, actions))
         if chessboard.color == Color.WHITE:
             extremum = actions[-1][0]
         else:
@@ -193,7 +202,7 @@ class MinimaxAgent(Agent):
             actions = [action for action in actions if abs(action[0] - extremum) < 1e-6]
 
         action = random.choice(actions)
-        chessboard.move_piece(*action[1:])
+        chessboard.move_piece(action[1])
         return chessboard.record
 
 
@@ -229,27 +238,28 @@ class AlphaBetaAgent(Agent):
 
         Based on the minimax algorithm, 
         some branches that do not affect the result are cut out.
+        Attacks are tried first, so that more branches can be cut out,
+        and split/merge movements are only generated if no cut-off happens.
         """
         deepth = self.deepth
         if chessboard.color == Color.WHITE:
-            index = self.max_value(chessboard, deepth, -float("inf"), float("inf"))[1]
+            action = self.max_value(chessboard, deepth, -float("inf"), float("inf"))[1]
         else:
-            index = self.min_value(chessboard, deepth, -float("inf"), float("inf"))[1]
+            action = self.min_value(chessboard, deepth, -float("inf"), float("inf"))[1]
 
-        actions = chessboard.actions()
-        chessboard.move_piece(*actions[index])
+        chessboard.move_piece(action)
         return chessboard.record
 
     def max_value(
         self, chessboard: ChessBoard, deepth: int, alpha: float, beta: float
-    ) -> Tuple[float, int, float, float]:
+    ) -> Tuple[float, Optional[int], float, float]:
         """
         Calculate the maximum value on this branch.
 
         Parameters
         ----------
         chessboard : ChessBoard
-            Current chessboard (a copy of the original chessboard).
+            Current chessboard. It is unchanged after the call.
         deepth : int
             Remaining maximum depth (for recursive calls).
         alpha : float
@@ -261,8 +271,9 @@ class AlphaBetaAgent(Agent):
         -------
         val : float
             Value of this branch.
-        index : int
-            Index of the optimal action.
+        action : int, optional
+            The optimal action packed by `ChessBoard.encode_action`.
+            None if the depth is 0.
         alpha : float
             Current maximum.
         beta : float
@@ -270,33 +281,35 @@ class AlphaBetaAgent(Agent):
 
         """
         if deepth == 0:
-            return chessboard.evaluate(self.evaluate), 0, alpha, beta
+            return chessboard.evaluate(self.evaluate), None, alpha, beta
 
         val = -float("inf")
-        index = 0
-        for i, s in enumerate(chessboard.actions()):
-            new_chessboard = chessboard.copy().move_piece(*s)
+        action = None
+        for s in chessboard.iter_actions(encoded=True):
+            action = s if action is None else action
+            chessboard.push(s)
             val = max(
                 val,
-                self.min_value(new_chessboard, deepth - 1, alpha, beta)[0],
+                self.min_value(chessboard, deepth - 1, alpha, beta)[0],
             )
+            chessboard.pop()
             if val >= beta:
                 break
             if val > alpha:
                 alpha = val
-                index = i
-        return val, index, alpha, beta
+                action = s
+        return val, action, alpha, beta
 
     def min_value(
         self, chessboard: ChessBoard, deepth: int, alpha: float, beta: float
-    ) -> Tuple[float, int, float, float]:
+    ) -> Tuple[float, Optional[int], float, float]:
         """
         Calculate the minimum value on this branch.
 
         Parameters
         ----------
         chessboard : ChessBoard
-            Current chessboard (a copy of the original chessboard).
+            Current chessboard. It is unchanged after the call.
         deepth : int
             Remaining maximum depth (for recursive calls).
         alpha : float
@@ -308,8 +321,9 @@ class AlphaBetaAgent(Agent):
         -------
         val : float
             Value of this branch.
-        index : int
-            Index of the optimal action.
+        action : int, optional
+            The optimal action packed by `ChessBoard.encode_action`.
+            None if the depth is 0.
         alpha : float
             Current maximum.
         beta : float
@@ -317,22 +331,24 @@ class AlphaBetaAgent(Agent):
 
         """
         if deepth == 0:
-            return chessboard.evaluate(self.evaluate), 0, alpha, beta
+            return chessboard.evaluate(self.evaluate), None, alpha, beta
 
         val = float("inf")
-        index = 0
-        for i, s in enumerate(chessboard.actions()):
-            new_chessboard = chessboard.copy().move_piece(*s)
+        action = None
+        for s in chessboard.iter_actions(encoded=True):
+            action = s if action is None else action
+            chessboard.push(s)
             val = min(
                 val,
-                self.max_value(new_chessboard, deepth - 1, alpha, beta)[0],
+                self.max_value(chessboard, deepth - 1, alpha, beta)[0],
             )
+            chessboard.pop()
             if val <= alpha:
                 break
             if val < beta:
                 beta = val
-                index = i
-        return val, index, alpha, beta
+                action = s
+        return val, action, alpha, beta
 
 
 class BeamSearchAgent(Agent):
@@ -374,55 +390,22 @@ class BeamSearchAgent(Agent):
         Only some optimal actions are retained at a time, 
         rather than all of the minimax algorithm.
         """
-        size = self.size
-        action_sequence = []
-
-        # Get all the action and its value
-        for action in chessboard.actions():
-            new_chessboard = chessboard.copy().move_piece(*action)
-            val = new_chessboard.evaluate(self.evaluate)
-            action_sequence.append([action, val, new_chessboard])
-
-        # Keep only some of the best actions
-        action_sequence.sort(key=lambda x: x[-2])
-        if chessboard.color == Color.WHITE:
-            action_sequence = action_sequence[-size:]
-        else:
-            action_sequence = action_sequence[:size]
+        # Get all the action and its value,
+        # and keep only some of the best actions
+        color = chessboard.color
+        action_sequence = self.expand(chessboard, color, [])
 
         # Adopt ideas similar to minimax algorithm:
         # The white side retains the actions with the highest score, 
         # and the black side retains the X with the lowest score
-        color = chessboard.color
         for _ in range(self.deepth - 1):
             color = Color.BLACK if color == Color.WHITE else Color.WHITE
             length = len(action_sequence)
             for _ in range(length):
                 item = action_sequence.pop(0)
-                new_action_sequence = []
                 # Record the action sequence and its corresponding value 
                 # in the form of tuple list
-                for action in item[-1].actions():
-                    new_chessboard = item[-1].copy().move_piece(*action)
-                    val = new_chessboard.evaluate(self.evaluate)
-                    # Expand new branch
-                    new_action_sequence.append(
-                        [
-                            *item[:-2],
-                            action,
-                            val,
-                            new_chessboard,
-                        ]
-                    )
-
-                # Keep only some of the best actions
-                new_action_sequence.sort(key=lambda x: x[-2])
-                if color == Color.WHITE:
-                    new_action_sequence = new_action_sequence[-size:]
-                else:
-                    new_action_sequence = new_action_sequence[:size]
-
-                action_sequence.extend(new_action_sequence)
+                action_sequence.extend(self.expand(item[-1], color, item[:-2]))
 
         for item in action_sequence:
             item.pop()
@@ -446,6 +429,51 @@ class BeamSearchAgent(Agent):
         chessboard.move_piece(*actions_list[values.index(extremum)])
         return chessboard.record
 
+    def expand(self, chessboard: ChessBoard, color: Color, prefix: list) -> list:
+        """
+        Expand a branch and keep only some of the best actions.
+
+        Notes
+        -----
+        Each action is tried by `push` and `pop`,
+        and the chessboard is copied only if the action is kept so far.
+
+        Parameters
+        ----------
+        chessboard : ChessBoard
+            The chessboard of the branch. It is unchanged after the call.
+        color : Color
+            The side whose best actions are kept.
+        prefix : list
+            The action sequence leading to the branch.
+
+        Returns
+        -------
+        sequence : list
+            Each item consists of the action sequence, its value
+            and the chessboard after the actions.
+
+        """
+        size = self.size
+        sequence = []
+        for action in chessboard.actions():
+            val = chessboard.push(action).evaluate(self.evaluate)
+            item = [*prefix, action, val, None]
+
+            # Keep only some of the best actions
+            sequence.append(item)
+            sequence.sort(key=lambda x: x[-2])
+            if color == Color.WHITE:
+                sequence = sequence[-size:]
+            else:
+                sequence = sequence[:size]
+
+            if any(x is item for x in sequence):
+                item[-1] = chessboard.copy()
+            chessboard.pop()
+
+        return sequence
+
     def todict(self, data: list) -> OrderedDict:
         """
         Convert tuple list to dictionary.
@@ -527,7 +555,9 @@ class HumanAgent(Agent):
         if isinstance(action, str):
             action = eval(action)
 
+        # Places may be given in any format accepted by `transform_place`.
         chessboard.move_piece(
-            [tuple(s) for s in action[0]], [tuple(t) for t in action[1]]
+            [tuple(chessboard.transform_place(s)) for s in action[0]],
+            [tuple(chessboard.transform_place(t)) for t in action[1]],
         )
         return chessboard.record
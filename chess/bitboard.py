@@ -0,0 +1,213 @@
+# Author       : czy
+# Description  : Bitboard representation of the chessboard data.
+#
+# Copyright 2022 Zhiyuan Chen <chenzhiyuan@mail.ustc.edu.cn>
+
+from typing import Any, Iterator, Optional, Tuple
+
+from chess.constant import Color, Name
+
+
+def square(place: Tuple[int, int]) -> int:
+    """Convert a (column, row) place to a square index from 0 to 63."""
+    return (place[1] - 1) * 8 + place[0] - 1
+
+
+def place(square: int) -> Tuple[int, int]:
+    """Convert a square index from 0 to 63 to a (column, row) place."""
+    return (square % 8 + 1, square // 8 + 1)
+
+
+# The place of each square index, so that no tuple is built for a lookup.
+PLACES = [place(sq) for sq in range(64)]
+
+
+def between(source: int, target: int) -> Tuple[int, ...]:
+    """
+    Get the square indices strictly between two squares,
+    in order from the source to the target.
+    It is empty if they are not on the same row, column or diagonal.
+    """
+    (x1, y1), (x2, y2) = PLACES[source], PLACES[target]
+    dx, dy = x2 - x1, y2 - y1
+    if (dx == 0 and dy == 0) or (dx != 0 and dy != 0 and abs(dx) != abs(dy)):
+        return ()
+
+    # One step along the line, in square indices.
+    step = ((dy > 0) - (dy < 0)) * 8 + (dx > 0) - (dx < 0)
+    return tuple(source + step * i for i in range(1, max(abs(dx), abs(dy))))
+
+
+# BETWEEN[source][target] is `between(source, target)`.
+BETWEEN = [[between(source, target) for target in range(64)] for source in range(64)]
+
+# Square transforms, where TRANSFORM[sq] is the square that `sq` is mapped to.
+# Both are their own inverse.
+IDENTITY = tuple(range(64))
+# Left-right mirror, which maps column `x` to column `9 - x`.
+MIRROR = tuple(sq ^ 7 for sq in range(64))
+
+
+def squares(mask: int) -> Iterator[int]:
+    """Iterate over the square indices of the bits set in `mask`."""
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
+
+class BitBoard:
+    """
+    Chessboard data stored as one 64-bit mask per color and piece type,
+    plus a 64-slot probability array.
+    Probabilities are fixed-point integers (see `chess.probability`).
+
+    Notes
+    -----
+    It behaves like the `defaultdict` used before:
+    the key is a (column, row) place,
+    and the value is a (color, name, probability) tuple,
+    or None if there are no pieces in this place.
+    Unlike `defaultdict`, reading an empty place does not insert anything.
+
+    Bit `i` of a mask corresponds to square `i`,
+    where square 0 is a1, square 7 is h1 and square 63 is h8.
+
+    """
+
+    def __init__(self) -> None:
+        # masks[color.value][name.value]
+        self.masks = [[0] * len(Name) for _ in Color]
+        # Probability of the piece on each square.
+        self.probabilities = [0] * 64
+        # Cache of (color, name, probability) on each square,
+        # so that a lookup is a single list index.
+        self._entries = [None] * 64
+        # Squares occupied by any piece.
+        self.occupied = 0
+        # Sum of the probabilities of each color and piece type,
+        # that is, the expected number of pieces on the chessboard.
+        self.mass = [[0] * len(Name) for _ in Color]
+
+    @staticmethod
+    def _square(key: Any) -> Optional[int]:
+        """Convert the key to a square index, or None if out of bounds."""
+        col, row = key
+        if 1 <= col <= 8 and 1 <= row <= 8:
+            return (row - 1) * 8 + col - 1
+        return None
+
+    def __getitem__(self, key: Tuple[int, int]) -> Optional[Tuple[Color, Name, int]]:
+        """Get the piece in a place, or None if there is no piece."""
+        sq = self._square(key)
+        return None if sq is None else self._entries[sq]
+
+    def __setitem__(
+        self, key: Tuple[int, int], value: Tuple[Color, Name, int]
+    ) -> None:
+        """Put a piece in a place, replacing the previous one."""
+        sq = self._square(key)
+        if sq is None:
+            raise KeyError(key)
+        self.put(sq, value)
+
+    def put(self, sq: int, value: Tuple[Color, Name, int]) -> None:
+        """Put a piece on a square index, replacing the previous one."""
+        self.remove(sq)
+
+        color, name, probability = value
+        bit = 1 << sq
+        self.masks[color.value][name.value] |= bit
+        self.occupied |= bit
+        self.mass[color.value][name.value] += probability
+        self.probabilities[sq] = probability
+        self._entries[sq] = value
+
+    def __delitem__(self, key: Tuple[int, int]) -> None:
+        """Remove the piece in a place (if any)."""
+        sq = self._square(key)
+        if sq is not None:
+            self.remove(sq)
+
+    def remove(self, sq: int) -> None:
+        """Remove the piece on a square index (if any)."""
+        entry = self._entries[sq]
+        if entry is None:
+            return
+
+        bit = ~(1 << sq)
+        self.masks[entry[0].value][entry[1].value] &= bit
+        self.occupied &= bit
+        self.mass[entry[0].value][entry[1].value] -= entry[2]
+        self.probabilities[sq] = 0
+        self._entries[sq] = None
+
+    def at(self, sq: int) -> Optional[Tuple[Color, Name, int]]:
+        """Same as `__getitem__`, but for a valid square index."""
+        return self._entries[sq]
+
+    def get(self, key: Tuple[int, int], default: Any = None) -> Any:
+        """Same as `dict.get`."""
+        value = self[key]
+        return default if value is None else value
+
+    def __contains__(self, key: Any) -> bool:
+        """Judge whether there is a piece in a place."""
+        try:
+            return self[key] is not None
+        except (TypeError, ValueError):
+            return False
+
+    def __iter__(self) -> Iterator[Tuple[int, int]]:
+        """Iterate over the occupied places."""
+        for sq in squares(self.occupied):
+            yield place(sq)
+
+    def __len__(self) -> int:
+        """Number of occupied places."""
+        return bin(self.occupied).count("1")
+
+    def keys(self) -> Iterator[Tuple[int, int]]:
+        """Same as `dict.keys`."""
+        return iter(self)
+
+    def values(self) -> Iterator[Tuple[Color, Name, int]]:
+        """Same as `dict.values`."""
+        entries = self._entries
+        for sq in squares(self.occupied):
+            yield entries[sq]
+
+    def items(self) -> Iterator[Tuple[Tuple[int, int], Tuple[Color, Name, int]]]:
+        """Same as `dict.items`."""
+        entries = self._entries
+        for sq in squares(self.occupied):
+            yield place(sq), entries[sq]
+
+    def copy(self) -> "BitBoard":
+        """Return a copy, which does not share any mutable state with self."""
+        board = BitBoard.__new__(BitBoard)
+        board.masks = [masks[:] for masks in self.masks]
+        board.probabilities = self.probabilities[:]
+        board._entries = self._entries[:]
+        board.occupied = self.occupied
+        board.mass = [mass[:] for mass in self.mass]
+        return board
+
+    def entries(self) -> Iterator[Tuple[int, Tuple[Color, Name, int]]]:
+        """Same as `items`, but the keys are square indices."""
+        entries = self._entries
+        for sq in squares(self.occupied):
+            yield sq, entries[sq]
+
+    def mask(self, color: Color, name: Optional[Name] = None) -> int:
+        """
+        Get the mask of the squares occupied by the pieces of `color`,
+        or only by the pieces of `color` and `name` if `name` is given.
+        """
+        if name is not None:
+            return self.masks[color.value][name.value]
+
+        mask = 0
+        for m in self.masks[color.value]:
+            mask |= m
+        return mask
@@ -0,0 +1,93 @@
+# Author       : czy
+# Description  : Least recently used cache with hit/miss counters.
+#
+# Copyright 2022 Zhiyuan Chen <chenzhiyuan@mail.ustc.edu.cn>
+
+import threading
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+
+
+class LRUCache:
+    """
+    Least recently used cache.
+
+    Parameters
+    ----------
+    size : int
+        The maximum number of items.
+        If it is 0, nothing will be cached.
+
+    Notes
+    -----
+    It may be shared by several threads (such as the web server),
+    so all operations are protected by a lock.
+
+    """
+
+    def __init__(self, size: int) -> None:
+        self.size = size
+        self.hits = 0
+        self.misses = 0
+
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Get the cached value, or None if it does not exist."""
+        with self._lock:
+            value = self._data.get(key)
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self._data.move_to_end(key)
+            return value
+
+    def put(self, key: Hashable, value: Any) -> None:
+        """Cache a value, and discard the least recently used one if full."""
+        if self.size <= 0:
+            return
+
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.size:
+                self._data.popitem(last=False)
+
+    def resize(self, size: int) -> None:
+        """Change the maximum number of items."""
+        with self._lock:
+            self.size = size
+            while len(self._data) > max(size, 0):
+                self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        """Discard all items and reset the counters."""
+        with self._lock:
+            self._data.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def info(self) -> dict:
+        """Return the size and the hit/miss counters."""
+        return {
+            "size": self.size,
+            "length": len(self._data),
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+    def __len__(self) -> int:
+        """Number of cached items."""
+        return len(self._data)
+
+    def __getstate__(self) -> dict:
+        """The lock cannot be copied or pickled."""
+        state = self.__dict__.copy()
+        del state["_lock"]
+        return state
+
+    def __setstate__(self, state: dict) -> None:
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
@@ -3,17 +3,28 @@
 #
 # Copyright 2022 Zhiyuan Chen <chenzhiyuan@mail.ustc.edu.cn>
 
-from typing import Any, Dict, List, Union
+import copy
+from typing import Any, Dict, List, Optional, Union
 
 from chess.agent import *
 from chess.chessboard import ChessBoard
-from chess.constant import Color, Winner
+from chess.constant import Color, Name, Winner
 from chess.database import Database
 from chess.game import Game
+from chess.probability import to_float
 
 
 class Chess:
-    """A chess game consisting of one chessboard and two players."""
+    """
+    A chess game consisting of one chessboard and two players.
+
+    Parameters
+    ----------
+    seed : int, str or bytes, optional
+        The seed of the measurements of the chessboards created by the game
+        (see `MeasureRandom`). If it is None, a random seed is chosen.
+
+    """
 
     @classmethod
     def agents(cls) -> List[str]:
@@ -83,6 +94,9 @@ class Chess:
             and the chessboard can be initialized with this data.
             If `chessboard` is int,
             the corresponding chessboard will be loaded from the database.
+            A new chessboard is seeded with the seed of the game,
+            and a given ChessBoard keeps its own random generator.
+            The records of the game start again from it.
 
         """
         # Initialize chessboard.
@@ -90,29 +104,41 @@ class Chess:
             self._chessboard = data
         elif isinstance(data, list):
             if len(data) > 0:
-                self._chessboard = ChessBoard(Game(data))
+                self._chessboard = ChessBoard(Game(data), self._seed)
             else:
-                self._chessboard = ChessBoard(Game())
+                self._chessboard = ChessBoard(Game(), self._seed)
         else:
-            self._chessboard = ChessBoard(Game.load(data))
+            self._chessboard = ChessBoard(Game.load(data), self._seed)
             # Since the chessboard in the database may turn to black,
             # it needs to be set.
             turn = self._database.get(data)["turn"]
             self._chessboard.color = Color.WHITE if not turn else Color.BLACK
 
+        # The initial position of the records, in the format of `Game`.
+        self._pieces = [
+            [(piece.color.name.lower(), piece.name.name.lower()), piece.places]
+            for piece in self._chessboard.pieces
+        ]
+        self._turn = int(self._chessboard.color == Color.BLACK)
+        self._records = []
+        self._stack = []
+
     @property
     def database(self) -> Database:
         """Get database."""
         return self._database
 
-    def __init__(self) -> None:
+    def __init__(self, seed: Optional[Any] = None) -> None:
+        self._seed = seed
         self._chessboard = None
         self._agent1 = None
         self._agent2 = None
 
         self._database = Database()
 
-        # Store chess records.
+        # Store chess records, each with the number of draws
+        # from the random generator of the chessboard before it
+        # and the action packed by `ChessBoard.encode_action`.
         self._records = []
         # Store the chessboard of each step to undo the previous step.
         self._stack = []
@@ -142,8 +168,8 @@ class Chess:
 
         """
 
-        # Record the current chessboard before playing chess.
-        self._stack.append(self._chessboard.copy())
+        # Copy the current chessboard before playing chess.
+        chessboard = self._chessboard.copy()
 
         # Select agent.
         if self._chessboard.color == Color.WHITE:
@@ -152,15 +178,95 @@ class Chess:
             agent = self._agent2
 
         # Perform actions.
+        draws = self._chessboard.random.counter
         record = agent.run(self._chessboard, *args)
 
-        # Log.
-        self._records.append(record)
+        # Log only after the agent succeeds,
+        # so that each record matches the chessboard `undo` restores.
+        self._stack.append(chessboard)
+        self._records.append((record, draws, self._chessboard.action))
         return record
 
+    @property
+    def records(self) -> dict:
+        """
+        The game record.
+
+        Notes
+        -----
+        It holds the seed of the measurements, the initial position
+        (the pieces in the format of `Game` and whose turn it is,
+        0 for white and 1 for black)
+        and each chess record with the number of draws before it
+        and its action, so that the game can be replayed exactly by `replay`.
+
+        Examples
+        --------
+        >>> chess.records
+        {'seed': 42, 'pieces': [[('white', 'rook'), [(1, 1, 1.0)]], ...], 'turn': 0, 'records': [('b2-b4', 0, 1609), ...]}
+
+        """
+        seed = self._chessboard.random.getstate()[0]
+        return {
+            "seed": seed,
+            "pieces": copy.deepcopy(self._pieces),
+            "turn": self._turn,
+            "records": self._records[:],
+        }
+
+    @classmethod
+    def replay(cls, records: dict) -> "Chess":
+        """
+        Rebuild a game from its `records`.
+
+        Notes
+        -----
+        Each action is performed again
+        after the random generator is set to the number of draws before it,
+        so the measurements have the same results as in the recorded game.
+        The agents are not set.
+
+        Parameters
+        ----------
+        records : dict
+            The records of a game, in the format of `Chess.records`.
+
+        Returns
+        -------
+        chess : Chess
+            The game after all the recorded actions,
+            which can be undone step by step.
+
+        """
+        chess = cls(records["seed"])
+        chess.chessboard = copy.deepcopy(records["pieces"])
+        chessboard = chess.chessboard
+        chessboard.color = Color.WHITE if not records["turn"] else Color.BLACK
+        chess._turn = records["turn"]
+
+        seed = chessboard.random.getstate()[0]
+        for record, draws, action in records["records"]:
+            chess._stack.append(chessboard.copy())
+            chessboard.random.setstate((seed, draws))
+            chessboard.move_piece(action)
+            if chessboard.record != record:
+                raise ValueError(
+                    f"Record mismatch: {chessboard.record!r} != {record!r}"
+                )
+            chess._records.append((record, draws, action))
+        return chess
+
+    def repetitions(self) -> int:
+        """
+        Get the number of times the current position has appeared in the game,
+        including now. The game is drawn when it reaches `setting.draw`.
+        """
+        return self._chessboard.repetitions()
+
     def undo(self) -> None:
         """Undo the previous step."""
         self._chessboard = self._stack.pop()
+        self._records.pop()
 
     def save(self, name: str) -> int:
         """
@@ -217,7 +323,7 @@ class Chess:
                     color, name, probability = piece
                     color = color.name.lower()
                     name = name.name.lower()
-                    d[f"{i}{j}"] = [color, name, probability]
+                    d[f"{i}{j}"] = [color, name, to_float(probability)]
         return d
 
     @property
@@ -280,25 +386,30 @@ class Chess:
 
         # If the piece exists on the chessboard,
         # remove it from the tomb list.
-        for piece in self._chessboard.pieces:
-            for place in piece.places:
-                if place[2] != 0:
-                    break
-            else:
-                continue
+        # The chessboard counts the surviving pieces of each type.
+        for color in Color:
+            pieces = tomb[color.name.lower()]
+            alive = {
+                name.name.lower(): self._chessboard.count(color, name) for name in Name
+            }
 
             # Due to the rules of `Pawn Promotion`,
-            # there may be multiple queens/knights/bishops/knights.
-            try:
-                if piece.color == Color.WHITE:
-                    tomb["white"].remove(piece.name.name.lower())
-                else:
-                    tomb["black"].remove(piece.name.name.lower())
-            except ValueError:
-                if piece.color == Color.WHITE:
-                    tomb["white"].remove("pawn")
+            # there may be multiple queens/knights/bishops/knights,
+            # and the extra ones used to be pawns.
+            for name in alive:
+                extra = alive[name] - pieces.count(name)
+                if name != "pawn" and extra > 0:
+                    alive[name] -= extra
+                    alive["pawn"] += extra
+
+            # Remove the first ones of each type.
+            dead = []
+            for name in pieces:
+                if alive[name] > 0:
+                    alive[name] -= 1
                 else:
-                    tomb["black"].remove("pawn")
+                    dead.append(name)
+            tomb[color.name.lower()] = dead
 
         return tomb
 
@@ -4,17 +4,22 @@
 #
 # Copyright 2022 Zhiyuan Chen <chenzhiyuan@mail.ustc.edu.cn>
 
-import copy
-from collections import defaultdict
-from typing import Any, Iterator, List, Optional, Tuple
+import struct
+from array import array
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple, Union
 
+from chess.bitboard import IDENTITY, MIRROR, PLACES, BitBoard, place, square, squares
+from chess.cache import LRUCache
 from chess.constant import Color, Name, Winner
 from chess.database import Database
 from chess.evaluate import *
 from chess.game import Game
-from chess.piece import Piece
-from chess.rule import ActionRule, SpecialMoveRule
+from chess.piece import Piece, PieceList
+from chess.probability import to_fixed
+from chess.rng import MeasureRandom
+from chess.rule import ActionRule, AttackActionRule, SpecialMoveRule
 from chess.settings import setting
+from chess.zobrist import SIDE, piece_key
 
 
 class ChessBoard:
@@ -26,12 +31,22 @@ class ChessBoard:
     ----------
     game : Game
         Initial chess pieces distribution.
+    seed : int, optional
+        The seed of the random generator of the measurements.
+        If it is None, a random seed is chosen.
 
     """
 
-    def __init__(self, game: Game) -> None:
+    # Cache of generated actions, shared by all chessboards.
+    cache = LRUCache(setting.action_cache_size)
+    # Version of the format of `pack`.
+    PACK_VERSION = 7
+
+    def __init__(self, game: Game, seed: Optional[int] = None) -> None:
         # Convert dict type pieces to Piece type.
         self.init_piece(game.pieces)
+        # All measurements of the actions draw from this generator.
+        self.pieces.random = MeasureRandom(seed)
         # The place distribution of chess pieces is transformed
         # into the distribution of chess pieces on the chessboard.
         self.place_piece()
@@ -40,22 +55,417 @@ class ChessBoard:
         self.color = Color.WHITE
         # Chess record.
         self.record = ""
+        # The last action packed by `encode_action`, or None.
+        self.action = None
+        # The information needed to undo the actions performed by `push`.
+        self._stack = []
+        # The (hash, clock) of the position before each action
+        # since the last capture, and the number of times each hash appears in it.
+        self._history = []
+        self._seen = {}
+        # The number of actions since the last capture (see `move_piece`).
+        self._clock = 0
 
     def init_piece(self, pieces) -> None:
         """Convert dict type pieces to Piece type."""
-        self.pieces = [Piece(piece[0][0], piece[0][1], piece[1]) for piece in pieces]
+        # The places are copied, so that the game data is never changed.
+        self.pieces = PieceList(
+            Piece(piece[0][0], piece[0][1], list(piece[1])) for piece in pieces
+        )
+        # The indices of the pieces not shared with other chessboards,
+        # which can be changed in place (see `copy`).
+        self._owned = set(range(len(self.pieces)))
 
-    def place_piece(self) -> None:
+    def place_piece(self, places: Optional[Iterable[Tuple[int, int]]] = None) -> None:
         """
         The place distribution of chess pieces is transformed
         into the distribution of chess pieces on the chessboard.
+
+        Parameters
+        ----------
+        places : iterable of tuple, optional
+            Only update these places.
+            If it is None, the whole chessboard is rebuilt.
+
         """
+        if places is not None:
+            return self._patch_piece({square(place) for place in places})
 
         # If key does not exist, it returns None instead of raise an exception.
-        self._data = defaultdict(lambda: None)
-        for piece in self.pieces:
-            for p in piece.places:
-                self._data[p[:2]] = (piece.color, piece.name, p[2])
+        self._data = BitBoard()
+        # The indices of the pieces on each square,
+        # which is the square-to-piece index of `self.pieces`.
+        owners = [[] for _ in range(64)]
+        # The probability of the first piece on each square.
+        occupancy = [0] * 64
+        for index, piece in enumerate(self.pieces):
+            for sq, p in zip(piece.squares, piece.probabilities):
+                self._data.put(sq, (piece.color, piece.name, p))
+                owners[sq].append(index)
+                if not occupancy[sq]:
+                    occupancy[sq] = p
+        self.pieces.owners = [tuple(owner) for owner in owners]
+        self.pieces.occupancy = occupancy
+
+        # The hash of each piece, and of all pieces.
+        self._hashes = [
+            piece_key(
+                piece.color,
+                piece.name,
+                piece.squares,
+                piece.probabilities,
+                i,
+                piece.kind,
+            )
+            for i, piece in enumerate(self.pieces)
+        ]
+        self._hash = 0
+        for key in self._hashes:
+            self._hash ^= key
+
+        # The same for the left-right mirror of the position.
+        self._mirror_hashes = [
+            self._mirror_key(piece, i) for i, piece in enumerate(self.pieces)
+        ]
+        self._mirror_hash = 0
+        for key in self._mirror_hashes:
+            self._mirror_hash ^= key
+
+        # The number of kings on the chessboard of each color,
+        # and the number of surviving pieces of each color and name.
+        self._kings = [0] * len(Color)
+        self._alive = [[0] * len(Name) for _ in Color]
+        self._states = [self._state(piece) for piece in self.pieces]
+        for state in self._states:
+            self._count(state, 1)
+
+        # For each color, the (mask of attacked squares, probability)
+        # from each square occupied by that color, built by `attack_map`.
+        # None means it has not been built yet.
+        self._attacks = [None] * len(Color)
+        # The squares whose attacks are out of date.
+        self._dirty = [set() for _ in Color]
+        # The result of `attack_map`, or None if it is out of date.
+        self._attack_maps = [None] * len(Color)
+
+    def _patch_piece(self, squares: set, indices: Iterable[int] = ()) -> None:
+        """
+        Update the chessboard only on the given squares.
+
+        Notes
+        -----
+        A piece that appears on one of these squares after an action
+        must have appeared on one of them before the action,
+        since actions report the places of the pieces they change.
+        So only the previous owners of these squares need to be placed again,
+        and the result is the same as rebuilding the whole chessboard.
+        Pieces changed in other ways (such as undoing an action)
+        are passed by `indices`.
+
+        """
+        candidates = sorted(
+            {index for sq in squares for index in self.pieces.owners[sq]}.union(
+                indices
+            )
+        )
+
+        owners = {}
+        occupancy = self.pieces.occupancy
+        for sq in squares:
+            self._data.remove(sq)
+            owners[sq] = []
+            occupancy[sq] = 0
+
+        # Place again in the order of `self.pieces`,
+        # so that the later piece covers the earlier one as before.
+        for index in candidates:
+            piece = self.pieces[index]
+            for sq, p in zip(piece.squares, piece.probabilities):
+                if sq in owners:
+                    self._data.put(sq, (piece.color, piece.name, p))
+                    if index not in owners[sq]:
+                        owners[sq].append(index)
+                    if not occupancy[sq]:
+                        occupancy[sq] = p
+
+        for sq, owner in owners.items():
+            self.pieces.owners[sq] = tuple(owner)
+
+        self._touch(squares)
+
+    def _touch(self, squares: set) -> None:
+        """
+        Mark the attacks changed by the given squares as out of date.
+
+        Notes
+        -----
+        Besides the pieces on these squares,
+        a piece attacking one of them may now be blocked or unblocked.
+        A piece not attacking any of them is not affected,
+        since its attacks stop before the first piece blocking the way.
+
+        """
+        mask = 0
+        for sq in squares:
+            mask |= 1 << sq
+
+        for color in range(len(Color)):
+            attacks = self._attacks[color]
+            if attacks is None:
+                continue
+
+            self._attack_maps[color] = None
+            dirty = self._dirty[color]
+            dirty.update(squares)
+            for sq, (attacked, _) in attacks.items():
+                if attacked & mask:
+                    dirty.add(sq)
+
+    def attack_map(self, color: Color) -> Tuple[int, Tuple[int, ...]]:
+        """
+        Get the squares attacked by the pieces of `color`.
+
+        Notes
+        -----
+        It is built on the first call, and then only the attacks
+        changed by the actions since the last call are computed again.
+
+        Returns
+        -------
+        mask : int
+            Bit `i` is set if square `i` is attacked.
+        probabilities : tuple of int
+            The maximum probability of the pieces attacking each square,
+            that is, the probability of the piece appearing in its place,
+            in fixed point (see `chess.probability`).
+
+        """
+        result = self._attack_maps[color.value]
+        if result is not None:
+            return result
+
+        attacks = self._attacks[color.value]
+        if attacks is None:
+            attacks = self._attacks[color.value] = {}
+            dirty = squares(self._data.mask(color))
+        else:
+            dirty = self._dirty[color.value]
+        for sq in dirty:
+            piece = self._data.at(sq)
+            if piece is None or piece[0] != color:
+                attacks.pop(sq, None)
+            else:
+                # The piece shown on the square is the last one placed there,
+                # and it moves by its own rule (see `Piece.kind`).
+                rule = self.pieces[self.pieces.owners[sq][-1]].rule
+                attacks[sq] = (rule.attacks(color, sq, self._data), piece[2])
+        self._dirty[color.value] = set()
+
+        mask = 0
+        probabilities = [0] * 64
+        for attacked, probability in attacks.values():
+            mask |= attacked
+            for sq in squares(attacked):
+                if probability > probabilities[sq]:
+                    probabilities[sq] = probability
+
+        result = self._attack_maps[color.value] = (mask, tuple(probabilities))
+        return result
+
+    def _compact(self, indices: Iterable[int]) -> set:
+        """
+        Compact the pieces of these indices by the limits in `setting.superposition`
+        (see `Piece.compact`), and return the squares changed by it.
+        """
+        limits = setting.superposition
+        width = limits["width"]
+        floor = to_fixed(limits["floor"])
+        changed = set()
+        for index in indices:
+            changed |= self.pieces[index].compact(width, floor)
+        return changed
+
+    def _own(self, indices: Iterable[int]) -> None:
+        """Copy the pieces of these indices if they are shared."""
+        for index in indices:
+            if index not in self._owned:
+                self.pieces[index] = self.pieces[index].copy()
+                self._owned.add(index)
+
+    def _refresh(self, indices: Iterable[int]) -> None:
+        """
+        Update the hash and the counters
+        after the pieces of these indices are changed.
+        """
+        for index in indices:
+            piece = self.pieces[index]
+            key = piece_key(
+                piece.color,
+                piece.name,
+                piece.squares,
+                piece.probabilities,
+                index,
+                piece.kind,
+            )
+            self._hash ^= self._hashes[index] ^ key
+            self._hashes[index] = key
+
+            key = self._mirror_key(piece, index)
+            self._mirror_hash ^= self._mirror_hashes[index] ^ key
+            self._mirror_hashes[index] = key
+
+            self._count(self._states[index], -1)
+            self._states[index] = self._state(piece)
+            self._count(self._states[index], 1)
+
+    @staticmethod
+    def _state(piece: Piece) -> Tuple[Color, Name, bool, bool]:
+        """
+        Get what the counters need to know about a piece:
+        its color, name, whether it is on the chessboard,
+        and whether it survives (may appear with a non-zero probability).
+        """
+        return (
+            piece.color,
+            piece.name,
+            len(piece.squares) > 0,
+            any([p != 0 for p in piece.probabilities]),
+        )
+
+    def _count(self, state: Tuple[Color, Name, bool, bool], delta: int) -> None:
+        """Add a piece in the given state to the counters, or remove it."""
+        color, name, on_board, alive = state
+        if on_board and name == Name.KING:
+            self._kings[color.value] += delta
+        if alive:
+            self._alive[color.value][name.value] += delta
+
+    def count(self, color: Color, name: Optional[Name] = None) -> int:
+        """
+        Get the number of surviving pieces of `color`,
+        or only those of `color` and `name` if `name` is given.
+        """
+        if name is not None:
+            return self._alive[color.value][name.value]
+        return sum(self._alive[color.value])
+
+    @property
+    def hash_key(self) -> int:
+        """
+        64-bit Zobrist hash of the current position,
+        including whose turn it is.
+
+        Notes
+        -----
+        It is updated incrementally after each action,
+        and should always be equal to `compute_hash()`.
+        Probabilities are fixed-point, so they are hashed exactly,
+        see `chess.zobrist` for details.
+
+        """
+        return self._hash ^ (SIDE if self.color == Color.BLACK else 0)
+
+    @staticmethod
+    def _mirror_key(piece: Piece, index: int) -> int:
+        """Get the key of a piece in the left-right mirror of the position."""
+        return piece_key(
+            piece.color,
+            piece.name,
+            [MIRROR[sq] for sq in piece.squares],
+            piece.probabilities,
+            index,
+            piece.kind,
+        )
+
+    def symmetric(self) -> bool:
+        """
+        Judge whether the position and its left-right mirror
+        follow the same rules (mirrored) and have the same value.
+
+        Notes
+        -----
+        Castling is the only rule that is not left-right symmetric.
+        It needs a rook, and pawns are always promoted to queens,
+        so castling is no longer possible once both sides have lost their rooks.
+        The queen tables of `ValueTable` and `QuantumValueTable`
+        are not left-right symmetric either, so there must be no queens.
+
+        """
+        alive = self._alive
+        return not any(
+            alive[color.value][name.value]
+            for color in Color
+            for name in (Name.ROOK, Name.QUEEN)
+        )
+
+    def canonical_key(self) -> Tuple[int, Tuple[int, ...]]:
+        """
+        Get the key of the canonical orientation of the current position,
+        so that positions that are left-right mirrors of each other
+        share the same key, when `symmetric` allows it.
+
+        Notes
+        -----
+        The key of a superposed piece depends on its index in the list
+        of pieces (see `chess.zobrist`), so a mirror is only found
+        if each superposed piece is mirrored by itself.
+        For example, a position whose mirror has the other knight superposed
+        gets a different key, although the positions are equivalent.
+
+        Returns
+        -------
+        key : int
+            64-bit key of the canonical position,
+            which is `hash_key` or the hash of its mirror.
+        transform : tuple
+            The square transform from the current position to the canonical one,
+            either `bitboard.IDENTITY` or `bitboard.MIRROR`.
+            It is its own inverse, so it also maps the squares of
+            actions stored for the canonical position back to this one.
+
+        """
+        side = SIDE if self.color == Color.BLACK else 0
+        key, mirror = self._hash ^ side, self._mirror_hash ^ side
+        if mirror < key and self.symmetric():
+            return mirror, MIRROR
+        return key, IDENTITY
+
+    def compute_hash(self) -> int:
+        """Compute the hash of the current position from scratch."""
+        key = SIDE if self.color == Color.BLACK else 0
+        for index, piece in enumerate(self.pieces):
+            key ^= piece_key(
+                piece.color,
+                piece.name,
+                piece.squares,
+                piece.probabilities,
+                index,
+                piece.kind,
+            )
+        return key
+
+    def repetitions(self) -> int:
+        """
+        Get the number of times the current position has appeared in the game,
+        including now (so it is 1 for a new position).
+        """
+        return self._seen.get(self.hash_key, 0) + 1
+
+    def draw(self) -> bool:
+        """
+        Judge whether the game is drawn by the draw rules in `setting.draw`:
+        the same position appears `repetition` times,
+        or `no_capture` moves of each side are played without any capture
+        (see `move_piece` for what counts as a capture).
+        A rule set to 0 is disabled.
+        """
+        rules = setting.draw
+        repetition = rules["repetition"]
+        no_capture = rules["no_capture"]
+        return bool(
+            (repetition and self.repetitions() >= repetition)
+            or (no_capture and self._clock >= 2 * no_capture)
+        )
 
     def game_over(self) -> Winner:
         """
@@ -64,23 +474,11 @@ class ChessBoard:
         """
 
         # Whether the white King exists.
-        white_king = any(
-            [
-                piece.name == Name.KING and len(piece.places) > 0
-                for piece in self.pieces
-                if piece.color == Color.WHITE
-            ]
-        )
+        white_king = self._kings[Color.WHITE.value] > 0
         # Whether the black King exists.
-        black_king = any(
-            [
-                piece.name == Name.KING and len(piece.places) > 0
-                for piece in self.pieces
-                if piece.color == Color.BLACK
-            ]
-        )
+        black_king = self._kings[Color.BLACK.value] > 0
         if white_king and black_king:
-            return Winner.NULL
+            return Winner.DRAW if self.draw() else Winner.NULL
         elif white_king and not black_king:
             return Winner.WHITE
         elif black_king and not white_king:
@@ -107,16 +505,75 @@ class ChessBoard:
 
         return place
 
-    def __getitem__(self, key: Any) -> Optional[Tuple[Color, Name, float]]:
+    @staticmethod
+    def encode_action(
+        source: Tuple[Tuple[int, int]], target: Tuple[Tuple[int, int]]
+    ) -> int:
+        """
+        Pack an action into one integer.
+
+        Notes
+        -----
+        Bits 0-17 hold three 6-bit square indices, and bits 18-19 hold the kind:
+        0 for normal movement (source, target),
+        1 for split movement (source, target1, target2),
+        2 for merge movement (source1, source2, target).
+        The result always fits in an unsigned 32-bit integer.
+
+        Examples
+        --------
+        >>> ChessBoard.encode_action(((1, 2),), ((1, 4),))
+        1544
+        >>> ChessBoard.decode_action(1544)
+        (((1, 2),), ((1, 4),))
+
+        """
+        if len(target) == 2:
+            kind, places = 1, (source[0], target[0], target[1])
+        elif len(source) == 2:
+            kind, places = 2, (source[0], source[1], target[0])
+        else:
+            kind, places = 0, (source[0], target[0])
+
+        code = kind << 18
+        for i, p in enumerate(places):
+            code |= square(p) << (6 * i)
+        return code
+
+    @staticmethod
+    def decode_action(code: int) -> Tuple[Tuple, Tuple]:
+        """Unpack an action packed by `encode_action` to (source, target)."""
+        kind = code >> 18
+        a = place(code & 63)
+        b = place(code >> 6 & 63)
+        if kind == 0:
+            return (a,), (b,)
+
+        c = place(code >> 12 & 63)
+        if kind == 1:
+            return (a,), (b, c)
+        else:
+            return (a, b), (c,)
+
+    def __getitem__(self, key: Any) -> Optional[Tuple[Color, Name, int]]:
         """
         Get the piece at a certain place on the chessboard.
-        The obtained pieces are returned in (color, name, probability) format.
+        The obtained pieces are returned in (color, name, probability) format,
+        where the probability is fixed-point (see `chess.probability`).
         If there are no pieces in this place, return None.
         """
         return self._data[self.transform_place(key)]
 
     @property
-    def data(self) -> defaultdict:
+    def random(self) -> MeasureRandom:
+        """
+        The random generator of the measurements.
+        Its (seed, counter) state identifies all the measurements to come.
+        """
+        return self.pieces.random
+
+    @property
+    def data(self) -> BitBoard:
         """A chessboard with chess pieces."""
         return self._data
 
@@ -126,13 +583,9 @@ class ChessBoard:
         (Due to the split movement, a chess piece may be in multiple positions.)
         """
         keys = [self.transform_place(key) for key in keys]
-        for piece in self.pieces:
-            # Only when the pieces in all positions
-            # originate from the same piece will the piece be returned.
-            if all([piece.find(key) for key in keys]):
-                return piece
-        else:
-            return None
+        # Only when the pieces in all positions
+        # originate from the same piece will the piece be returned.
+        return self.pieces.find(*keys)
 
     def select_piece(self, color: Color) -> Iterator[Tuple[int, int]]:
         """Get all the surviving pieces according to the color."""
@@ -140,12 +593,13 @@ class ChessBoard:
             if piece.color != color:
                 continue
 
-            places = [place[:2] for place in piece.places]
-            for place in places:
-                yield (place,)
+            for sq in piece.squares:
+                yield (place(sq),)
 
     def move_piece(
-        self, source: Tuple[Tuple[int, int]], target: Tuple[Tuple[int, int]]
+        self,
+        source: Union[Tuple[Tuple[int, int]], int],
+        target: Optional[Tuple[Tuple[int, int]]] = None,
     ) -> "ChessBoard":
         """
         Move the piece.
@@ -156,12 +610,21 @@ class ChessBoard:
         For split movement, there is one source and two targets.
         For merge movement, there are two sources and one target.
 
+        An action is a capture if it follows `AttackActionRule`,
+        or if it removes any probability of the opponent's pieces
+        (such as a split or merge movement onto them).
+        A capture resets the clock of the no-capture draw rule.
+        If it removes any probability, no earlier position can appear again,
+        so the history of positions is dropped as well.
+
         Parameters
         ----------
-        source : tuple
-            The initial place of the chess piece.
-        target : tuple
+        source : tuple or int
+            The initial place of the chess piece,
+            or the whole action packed by `encode_action`.
+        target : tuple, optional
             The end place of the chess piece.
+            Omitted if `source` is a packed action.
 
         Returns
         -------
@@ -169,60 +632,489 @@ class ChessBoard:
             A new chessboard.
 
         """
+        # Remember the position before the action for the draw rules.
+        key = self.hash_key
 
         # Get the piece to move according to the source.
-        piece = self.get_piece(source)
+        if target is None:
+            self.action = source
+            source, target = self.decode_action(source)
+            # Packed actions always hold valid places.
+            piece = self.pieces.find(*source)
+        else:
+            piece = self.get_piece(source)
+            for p in target:
+                self.transform_place(p)
+            self.action = self.encode_action(source, target)
         # All current pieces.
         pieces = self.pieces
 
-        # All subclasses of ActionRule constitute the rules of movement.
-        for rule in ActionRule.__subclasses__():
-            color = piece.color
-            name = piece.name
-            # If the current action matches to a rule, 
-            # the action will be carried out according to 
-            # the action method determined by the rule.
-            if rule.condition(color, name, source, target, self.data):
-                self.record = rule.action(color, name, source, target, pieces)
-                # Update the chessboard after the action is completed.
+        color = piece.color
+        name = piece.name
+        # The pieces that may be changed by the action, including measurement.
+        # They must not be shared before they are changed.
+        indices = self._owners(source, target)
+        self._own(indices)
+        mass = self._mass(color, indices)
+        # If the current action matches to a rule, 
+        # the action will be carried out according to 
+        # the action method determined by the rule.
+        rule = ActionRule.dispatch(color, name, source, target, self.data)
+        if rule is not None:
+            result = rule.action(color, name, source, target, pieces)
+            changed = self._compact(indices)
+            # Update the chessboard after the action is completed.
+            # Only the places touched by the action need to be updated.
+            if isinstance(result, str):
+                self.record = result
                 self.place_piece()
-                break
+            else:
+                self.record, places = result
+                self.place_piece(set(places) | {PLACES[sq] for sq in changed})
+                self._refresh(indices)
 
         # When one side finishes playing chess, it's the other side's turn.
         self.color = Color.BLACK if self.color == Color.WHITE else Color.WHITE
+
+        self._history.append((key, self._clock))
+        self._seen[key] = self._seen.get(key, 0) + 1
+        captured = self._mass(color, indices) < mass
+        if captured:
+            # New objects, since `push` keeps the old ones to be restored.
+            self._history = []
+            self._seen = {}
+        if captured or (rule is not None and issubclass(rule, AttackActionRule)):
+            self._clock = 0
+        else:
+            self._clock += 1
         # Return self for chain call.
         return self
 
-    def actions(self, color: Optional[Color] = None) -> list:
-        """Get a list of all possible actions."""
+    def push(self, action: Union[Tuple[Tuple, Tuple], int]) -> "ChessBoard":
+        """
+        Perform an action in place, and remember how to undo it.
+
+        Notes
+        -----
+        Different from `copy().move_piece(...)`,
+        nothing is copied except the pieces changed by the action,
+        so it is much cheaper when searching.
+        The action can be undone exactly by `pop`,
+        including the changes of probability, the measurement results
+        and the draws from the random generator.
+
+        Parameters
+        ----------
+        action : tuple or int
+            The action consisting of source and target,
+            or packed by `encode_action`.
+
+        Returns
+        -------
+        chessboard : ChessBoard
+            Self for chain call.
+
+        """
+        if isinstance(action, int):
+            source, target = self.decode_action(action)
+        else:
+            source, target = action
+            # Validate the places before anything is changed.
+            for p in (*source, *target):
+                self.transform_place(p)
+            # Packed actions are trusted by `move_piece`,
+            # so the places are not validated again.
+            action = self.encode_action(source, target)
+
+        # Keep the pieces themselves, and let the action change their copies.
+        pieces = [(index, self.pieces[index]) for index in self._owners(source, target)]
+        self._owned.difference_update(index for index, _ in pieces)
+        state = self.color, self.record, self.action, self.pieces.random.counter
+        history = self._history
+
+        self.move_piece(action)
+
+        # The history is only kept if a capture has dropped it.
+        history = None if history is self._history else history
+        self._stack.append((*state, pieces, history))
+        return self
+
+    def pop(self) -> "ChessBoard":
+        """
+        Undo the last action performed by `push`.
+
+        Returns
+        -------
+        chessboard : ChessBoard
+            Self for chain call.
+
+        """
+        self.color, self.record, self.action, draws, pieces, history = self._stack.pop()
+        self.pieces.random.counter = draws
+
+        if history is not None:
+            # It may also be kept by a copy made before `pop`.
+            self._history, self._seen = self._restore_history(history)
+        key, self._clock = self._history.pop()
+        if self._seen[key] > 1:
+            self._seen[key] -= 1
+        else:
+            del self._seen[key]
+
+        squares = set()
+        for index, piece in pieces:
+            # The places of the piece both before and after the action.
+            squares.update(self.pieces[index].squares)
+            squares.update(piece.squares)
+            self.pieces[index] = piece
+            # It may also be kept by a copy made before `pop`.
+            self._owned.discard(index)
+
+        indices = [index for index, _ in pieces]
+        self._patch_piece(squares, indices)
+        self._refresh(indices)
+        return self
+
+    def _owners(self, source: Tuple, target: Tuple) -> set:
+        """
+        Get the indices of the pieces at the source or the target,
+        which are the only pieces that can be changed by an action.
+        """
+        owners = self.pieces.owners
+        return {
+            index for place in (*source, *target) for index in owners[square(place)]
+        }
+
+    def _mass(self, color: Color, indices: Iterable[int]) -> int:
+        """Get the total probability of the opponent's pieces among `indices`."""
+        return sum(
+            sum(self.pieces[index].probabilities)
+            for index in indices
+            if self.pieces[index].color != color
+        )
+
+    def actions(
+        self, color: Optional[Color] = None, encoded: bool = False
+    ) -> Union[list, array]:
+        """
+        Get a list of all possible actions.
+
+        Parameters
+        ----------
+        color : Color, optional
+            The side to move. Defaults to `self.color`.
+        encoded : bool
+            If true, return an `array('I')` of actions
+            packed by `encode_action` instead of a list of tuples.
+
+        """
         color = color or self.color
+
+        # The same position may be asked for many times,
+        # such as by the agents and by the web server.
+        key = (self.hash_key, color, encoded)
+        data = self.cache.get(key)
+        if data is None:
+            data = self.generate_actions(color)
+            if encoded:
+                encode = self.encode_action
+                data = array("I", [encode(source, target) for source, target in data])
+            self.cache.put(key, data)
+
+        # Return a copy, so that the cached one is never changed.
+        return data[:]
+
+    def generate_actions(self, color: Color) -> list:
+        """
+        Generate a list of all possible actions, without `cache`.
+        Same as `actions`, but always built from the pieces.
+        """
+        data = self.base_actions(color)
+
+        # Special actions such as split movement and convergence movement 
+        # are combined from ordinary actions.
+        for rule in SpecialMoveRule.__subclasses__():
+            data = rule.transform(data, self.pieces)
+        return data
+
+    def base_actions(self, color: Color) -> list:
+        """Get a list of all ordinary actions with one source and one target."""
         data = []
+        pieces = self.pieces
         # Select one of all pieces as the source.
-        for source in self.select_piece(color):
-            piece = self.get_piece(source)
-            if piece:
+        # The places come from the pieces themselves, so there is
+        # no need to validate them like `select_piece` and `get_piece`.
+        for selected in pieces:
+            if selected.color != color:
+                continue
+
+            for sq in selected.squares:
+                # The first piece that may appear there moves.
+                piece = pieces[pieces.owners[sq][0]]
+                source = (PLACES[sq],)
                 # Determine the reachable target according to 
                 # the moving rules of the piece.
                 data.extend(
-                    [(source, target) for target in piece.next(source, self.data)]
+                    [
+                        (source, (PLACES[target],))
+                        for target in piece.next_squares(sq, self._data)
+                    ]
                 )
+        return data
 
-        # Special actions such as split movement and convergence movement 
-        # are combined from ordinary actions.
-        for rule in SpecialMoveRule.__subclasses__():
-            data = rule.transform(data, self.pieces)
+    def iter_actions(
+        self,
+        color: Optional[Color] = None,
+        stages: Optional[Iterable[str]] = None,
+        encoded: bool = False,
+    ) -> Iterator[Union[Tuple[Tuple, Tuple], int]]:
+        """
+        Lazily generate all possible actions stage by stage.
 
-        return data
+        Notes
+        -----
+        The ordinary actions are generated when the first stage starts,
+        but the special actions of a stage are only combined
+        when the stage is reached.
+        So a search that stops early never pays for the later stages,
+        such as the split movements, whose number is quadratic.
+
+        Parameters
+        ----------
+        color : Color, optional
+            The side to move. Defaults to `self.color`.
+        stages : iterable of str, optional
+            Stages to generate, in order.
+            `captures` are ordinary actions attacking the opponent's pieces,
+            `quiet` are the other ordinary actions,
+            and the others are the `stage` of `SpecialMoveRule` subclasses
+            (`splits` and `merges`).
+            Defaults to all stages in the order above.
+        encoded : bool
+            If true, yield actions packed by `encode_action`.
+
+        Returns
+        -------
+        action : tuple or int
+            Possible action.
+
+        """
+        color = color or self.color
+        rules = SpecialMoveRule.__subclasses__()
+        if stages is None:
+            stages = ["captures", "quiet", *[rule.stage for rule in rules]]
+
+        data = self.base_actions(color)
+        for stage in stages:
+            if stage == "captures" or stage == "quiet":
+                captures = stage == "captures"
+                actions = (
+                    action
+                    for action in data
+                    if self.is_capture(color, action[1][0]) == captures
+                )
+            else:
+                actions = (
+                    action
+                    for rule in rules
+                    if rule.stage == stage
+                    for action in rule.generate(data, self.pieces)
+                )
+
+            if encoded:
+                encode = self.encode_action
+                yield from (encode(source, target) for source, target in actions)
+            else:
+                yield from actions
+
+    def is_capture(self, color: Color, place: Tuple[int, int]) -> bool:
+        """Judge whether moving to the place attacks the opponent's piece."""
+        piece = self._data[place]
+        return piece is not None and piece[0] != color
 
     def copy(self) -> "ChessBoard":
         """
-        Return a deep copy of self.
+        Return a copy of self.
         Actions performed on the copy do not affect the original chessboard.
+
+        Notes
+        -----
+        The pieces are shared by both chessboards (copy-on-write),
+        and a piece is copied only when an action is about to change it,
+        so at most a few pieces are copied for each action.
+
+        """
+        board = ChessBoard.__new__(ChessBoard)
+        board.__dict__.update(self.__dict__)
+        board.pieces = self.pieces.copy()
+        board._data = self._data.copy()
+        board._hashes = self._hashes[:]
+        board._mirror_hashes = self._mirror_hashes[:]
+        board._kings = self._kings[:]
+        board._alive = [alive[:] for alive in self._alive]
+        board._states = self._states[:]
+        board._attacks = [
+            None if attacks is None else dict(attacks) for attacks in self._attacks
+        ]
+        board._dirty = [set(dirty) for dirty in self._dirty]
+        board._attack_maps = self._attack_maps[:]
+        board._stack = self._stack[:]
+        board._history = self._history[:]
+        board._seen = dict(self._seen)
+
+        # Now all pieces are shared, neither chessboard owns any of them.
+        board._owned = set()
+        self._owned = set()
+        return board
+
+    def pack(self) -> bytes:
+        """
+        Pack the chessboard into bytes, which is also used for pickling.
+
+        Notes
+        -----
+        Only the pieces, whose turn it is, the record, the last action,
+        the state of the random generator,
+        the information to undo the actions performed by `push`
+        and the history of positions for the draw rules
+        are packed (see `Piece.pack` for the pieces).
+        Everything else is rebuilt by `unpack`.
+        A chessboard without superposed pieces takes about a hundred bytes.
+
         """
-        return copy.deepcopy(self)
+        data = bytearray(
+            struct.pack("<BBB", self.PACK_VERSION, self.color.value, len(self.pieces))
+        )
+        for piece in self.pieces:
+            data += piece.pack()
+
+        record = self.record.encode()
+        data += struct.pack("<H", len(record)) + record
+        data += struct.pack("<i", -1 if self.action is None else self.action)
+        data += struct.pack("<QQ", *self.pieces.random.getstate())
+
+        data += struct.pack("<H", len(self._stack))
+        for color, record, action, draws, pieces, history in self._stack:
+            record = record.encode()
+            data += struct.pack("<BHQ", color.value, len(record), draws) + record
+            data += struct.pack("<i", -1 if action is None else action)
+            data += struct.pack("<B", len(pieces))
+            for index, piece in pieces:
+                data += struct.pack("<B", index) + piece.pack()
+            data += struct.pack("<B", history is not None)
+            if history is not None:
+                data += self._pack_history(history)
+
+        data += struct.pack("<I", self._clock) + self._pack_history(self._history)
+        return bytes(data)
+
+    @staticmethod
+    def _pack_history(history: List[Tuple[int, int]]) -> bytes:
+        """Pack the (hash, clock) history of positions."""
+        data = bytearray(struct.pack("<I", len(history)))
+        for key, clock in history:
+            data += struct.pack("<QI", key, clock)
+        return bytes(data)
+
+    @staticmethod
+    def _unpack_history(
+        data: bytes, offset: int
+    ) -> Tuple[List[Tuple[int, int]], int]:
+        """Unpack the history packed by `_pack_history` at `offset`."""
+        (length,) = struct.unpack_from("<I", data, offset)
+        offset += 4
+        history = []
+        for _ in range(length):
+            history.append(struct.unpack_from("<QI", data, offset))
+            offset += 12
+        return history, offset
+
+    @staticmethod
+    def _restore_history(
+        history: List[Tuple[int, int]]
+    ) -> Tuple[List[Tuple[int, int]], Dict[int, int]]:
+        """Copy the history, and count the number of times each hash appears."""
+        seen = {}
+        for key, _ in history:
+            seen[key] = seen.get(key, 0) + 1
+        return list(history), seen
+
+    @classmethod
+    def unpack(cls, data: bytes) -> "ChessBoard":
+        """Create a chessboard from the bytes packed by `pack`."""
+        chessboard = cls.__new__(cls)
+        chessboard.__setstate__(data)
+        return chessboard
+
+    def __getstate__(self) -> bytes:
+        """Pickle the chessboard as the bytes packed by `pack`."""
+        return self.pack()
+
+    def __setstate__(self, state: bytes) -> None:
+        """Restore the chessboard from the bytes packed by `pack`."""
+        version, color, count = struct.unpack_from("<BBB", state)
+        if version != self.PACK_VERSION:
+            raise ValueError(f"Unsupported chessboard format: {version}")
+        offset = 3
+
+        pieces = []
+        for _ in range(count):
+            piece, offset = Piece.unpack(state, offset)
+            pieces.append(piece)
+        self.pieces = PieceList(pieces)
+        self._owned = set(range(len(self.pieces)))
+        self.place_piece()
+
+        self.color = Color(color)
+        (length,) = struct.unpack_from("<H", state, offset)
+        offset += 2
+        self.record = state[offset : offset + length].decode()
+        offset += length
+        (action,) = struct.unpack_from("<i", state, offset)
+        offset += 4
+        self.action = None if action < 0 else action
+        self.pieces.random = MeasureRandom.__new__(MeasureRandom)
+        self.pieces.random.setstate(struct.unpack_from("<QQ", state, offset))
+        offset += 16
+
+        self._stack = []
+        (depth,) = struct.unpack_from("<H", state, offset)
+        offset += 2
+        for _ in range(depth):
+            color, length, draws = struct.unpack_from("<BHQ", state, offset)
+            offset += 11
+            record = state[offset : offset + length].decode()
+            offset += length
+            (action,) = struct.unpack_from("<i", state, offset)
+            offset += 4
+            action = None if action < 0 else action
+
+            count = state[offset]
+            offset += 1
+            pieces = []
+            for _ in range(count):
+                index = state[offset]
+                piece, offset = Piece.unpack(state, offset + 1)
+                pieces.append((index, piece))
+            history = None
+            if state[offset]:
+                history, offset = self._unpack_history(state, offset + 1)
+            else:
+                offset += 1
+            self._stack.append((Color(color), record, action, draws, pieces, history))
+
+        (self._clock,) = struct.unpack_from("<I", state, offset)
+        history, offset = self._unpack_history(state, offset + 4)
+        self._history, self._seen = self._restore_history(history)
 
     def evaluate(self, method: Optional[Evaluate] = None) -> float:
-        """Evaluate the current situation."""
+        """
+        Evaluate the current situation.
+        A position drawn by the draw rules is worth 0 for both sides,
+        so that searching avoids repeating positions when it is ahead.
+        """
+        if self.draw():
+            return 0.0
         method = method or eval(setting.evaluation_class)
         return method.evaluate(self._data)
 
@@ -31,6 +31,14 @@ class State(Enum):
     UNREACHABLE = 2
 
 
+class Occupancy(Enum):
+    """The occupancy of the target place when dispatching actions."""
+    EMPTY = 0
+    ENEMY = 1
+    OWN_KING = 2
+    OWN = 3
+
+
 class Winner(Enum):
     """The winner of the game."""
     DRAW = -1
@@ -5,14 +5,16 @@
 
 import abc
 
+from chess.bitboard import BitBoard
 from chess.constant import Color
+from chess.probability import ONE
 
 
 class Evaluate(metaclass=abc.ABCMeta):
     """The base class of all evaluation classes."""
 
     @abc.abstractmethod
-    def evaluate(data: dict) -> float:
+    def evaluate(data: BitBoard) -> float:
         """
         Input chessboard data and output the assessed value.
         
@@ -50,17 +52,46 @@ class RelativeStrength(Evaluate):
     king_white_value = 900
     king_black_value = -king_white_value
 
+    # The values above indexed by color and name.
+    values = [
+        # White
+        [
+            king_white_value,
+            queen_white_value,
+            rook_white_value,
+            bishop_white_value,
+            knight_white_value,
+            pawn_white_value,
+        ],
+        # Black
+        [
+            king_black_value,
+            queen_black_value,
+            rook_black_value,
+            bishop_black_value,
+            knight_black_value,
+            pawn_black_value,
+        ],
+    ]
+
     @staticmethod
-    def evaluate(data: dict) -> float:
-        """Calculate the total value of the currently surviving pieces."""
+    def material(data: BitBoard) -> float:
+        """
+        Calculate the total value of the currently surviving pieces
+        from the probability mass kept by the chessboard data,
+        without visiting any square.
+        """
         total_value = 0
-        for _, v in data.items():
-            color, name, probability = v
-            value = eval(
-                f"RelativeStrength.{name.name.lower()}_{color.name.lower()}_value"
-            )
-            total_value += value * probability
-        return total_value
+        for values, mass in zip(RelativeStrength.values, data.mass):
+            for value, probability in zip(values, mass):
+                total_value += value * probability
+        # The mass is fixed-point.
+        return total_value / ONE
+
+    @staticmethod
+    def evaluate(data: BitBoard) -> float:
+        """Calculate the total value of the currently surviving pieces."""
+        return RelativeStrength.material(data)
 
 
 class ValueTable(Evaluate):
@@ -149,22 +180,21 @@ class ValueTable(Evaluate):
     king_black_value_correct = king_white_value_correct[::-1]
 
     @staticmethod
-    def evaluate(data: dict) -> float:
+    def evaluate(data: BitBoard) -> float:
         """Calculate the total value of the currently surviving pieces."""
-        total_value = 0
-        for k, v in data.items():
-            col, row = k[0] - 1, k[1] - 1
+        # Only the correction of the places needs to visit the squares.
+        total_value = RelativeStrength.material(data)
+        for sq, v in data.entries():
+            row, col = divmod(sq, 8)
             color, name, probability = v
+            probability /= ONE
             table = eval(
                 f"ValueTable.{name.name.lower()}_{color.name.lower()}_value_correct"
             )
-            value = eval(
-                f"RelativeStrength.{name.name.lower()}_{color.name.lower()}_value"
-            )
             if color == Color.WHITE:
-                total_value += (value + table[row][col]) * probability
+                total_value += table[row][col] * probability
             else:
-                total_value += (value - table[row][col]) * probability
+                total_value -= table[row][col] * probability
         return total_value
 
 
@@ -341,17 +371,23 @@ class QuantumValueTable(Evaluate):
         [0, 0],
     ]
 
+    # `value_table` indexed by square index instead of row and column.
+    square_table = [
+        [[value for row in table for value in row] for table in tables]
+        for tables in value_table
+    ]
+
     @staticmethod
-    def evaluate(data: dict) -> float:
+    def evaluate(data: BitBoard) -> float:
         """Calculate the total value of the currently surviving pieces."""
         total_value = 0
-        value_table = QuantumValueTable.value_table
+        square_table = QuantumValueTable.square_table
         probability_table = QuantumValueTable.probability_table
-        for k, v in data.items():
-            col, row = k[0] - 1, k[1] - 1
+        for sq, v in data.entries():
             color, name, probability = v
+            probability /= ONE
             # Reward actions with multiple distractions
             if probability > probability_table[name.value][0]:
                 probability += (1 - probability) * probability_table[name.value][1]
-            total_value += value_table[color.value][name.value][row][col] * probability
+            total_value += square_table[color.value][name.value][sq] * probability
         return total_value
@@ -0,0 +1,392 @@
+# Author       : czy
+# Description  : Differential fuzzing of the optimized chessboard
+#                against the reference implementation of the rules.
+#
+# Copyright 2022 Zhiyuan Chen <chenzhiyuan@mail.ustc.edu.cn>
+
+import abc
+import copy
+import random
+from collections import defaultdict
+from itertools import combinations
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+import click
+
+from chess.bitboard import PLACES
+from chess.chessboard import ChessBoard
+from chess.constant import Color, Name, State, Winner
+from chess.game import Game, standard
+from chess.piece import Piece
+from chess.rng import MeasureRandom
+from chess.rule import ActionRule, Rule
+
+
+class Engine(metaclass=abc.ABCMeta):
+    """
+    Base class of the engines compared by the fuzzer.
+
+    Parameters
+    ----------
+    pieces : list
+        Initial chess pieces distribution, in the format of `Game`.
+    seed : int
+        The seed of the measurements.
+
+    """
+
+    @abc.abstractmethod
+    def actions(self) -> set:
+        """Get the set of all possible actions."""
+        pass
+
+    @abc.abstractmethod
+    def move(self, action: Tuple[Tuple, Tuple]) -> str:
+        """Perform an action and return its record."""
+        pass
+
+    @abc.abstractmethod
+    def state(self) -> tuple:
+        """Get the state of the chessboard compared after each action."""
+        pass
+
+
+class Pieces(list):
+    """
+    Plain list of pieces, which only carries
+    the random generator of the measurements (see `Rule.rng`).
+    Without a square-to-piece index, the rules scan the whole list.
+    """
+
+    def __init__(self, pieces: Iterable[Piece], seed: int) -> None:
+        super().__init__(pieces)
+        self.random = MeasureRandom(seed)
+
+
+class ReferenceEngine(Engine):
+    """
+    The rules as they are written in `rule.py`, without `ChessBoard`:
+    pieces are found by scanning the list, moves are generated
+    by stepping through `MoveRule.moves`, the action rule is the first one
+    whose `condition` holds, nothing is cached or compacted,
+    and the chessboard data is rebuilt from scratch after each action.
+    """
+
+    def __init__(self, pieces: list, seed: int) -> None:
+        game = Game(copy.deepcopy(pieces))
+        self.pieces = Pieces(
+            [Piece(piece[0][0], piece[0][1], piece[1]) for piece in game.pieces], seed
+        )
+        self.color = Color.WHITE
+        self.rebuild()
+
+    def rebuild(self) -> None:
+        """Place all the pieces on an empty chessboard."""
+        # Later pieces cover earlier ones.
+        self.data = defaultdict(lambda: None)
+        for piece in self.pieces:
+            for sq, p in zip(piece.squares, piece.probabilities):
+                self.data[PLACES[sq]] = (piece.color, piece.name, p)
+
+    def find(self, places: Tuple[Tuple[int, int]]) -> Optional[Piece]:
+        """Find the first piece that may appear in all the places."""
+        for piece in self.pieces:
+            if all([piece.find(place) for place in places]):
+                return piece
+        return None
+
+    def next(self, piece: Piece, selected: Tuple[int, int]) -> Iterator[Tuple]:
+        """Generate the places the piece can move to from `selected`."""
+        rule = piece.rule
+        for move in rule.moves:
+            for step in move:
+                next = (selected[0] + step[0], selected[1] + step[1])
+                if Rule.overstep(next):
+                    break
+
+                state = rule.check(piece.color, selected, next, self.data[next])
+                if state == State.UNREACHABLE:
+                    break
+                yield next
+                if state == State.REACHABLE:
+                    break
+
+    def actions(self) -> set:
+        data = []
+        for piece in self.pieces:
+            if piece.color != self.color:
+                continue
+            for sq in piece.squares:
+                source = (PLACES[sq],)
+                owner = self.find(source)
+                if owner:
+                    data.extend([(source, (t,)) for t in self.next(owner, source[0])])
+        return set(data + self.splits(data) + self.merges(data))
+
+    def splits(self, data: list) -> list:
+        """Combine each two targets of the same source into a split movement."""
+        src_dict = {}
+        for source, target in data:
+            # Pawn can't split move.
+            src_piece = self.find(source)
+            if src_piece.name == Name.PAWN:
+                continue
+
+            src_dict.setdefault(source[0], [])
+            # Can only split to space unoccupied or occupied by similar pieces.
+            dst_piece = self.find(target)
+            if (not dst_piece) or (
+                dst_piece.color == src_piece.color and dst_piece.name == src_piece.name
+            ):
+                src_dict[source[0]].append(target[0])
+
+        return [
+            ((source,), (dst1, dst2))
+            for source, targets in src_dict.items()
+            for dst1, dst2 in combinations(targets, 2)
+            if dst1 != dst2
+        ]
+
+    def merges(self, data: list) -> list:
+        """
+        Combine each two sources of the same piece and the same empty target
+        into a merge movement.
+        """
+        dst_dict = {}
+        for source, target in data:
+            dst_dict.setdefault(target[0], []).append(source[0])
+
+        actions = []
+        for target, sources in dst_dict.items():
+            dst_piece = self.find((target,))
+            for src1, src2 in combinations(sources, 2):
+                # Only homologous pieces can be merged.
+                src_piece = self.find((src1,))
+                if src_piece.find(src2) and dst_piece is None and src1 != src2:
+                    actions.append(((src1, src2), (target,)))
+        return actions
+
+    def move(self, action: Tuple[Tuple, Tuple]) -> Optional[str]:
+        source, target = action
+        piece = self.find(source)
+        # An action matching no rule is reported as a differing record.
+        self.record = None
+        for rule in ActionRule.__subclasses__():
+            color, name = piece.color, piece.name
+            if rule.condition(color, name, source, target, self.data):
+                result = rule.action(color, name, source, target, self.pieces)
+                self.record = result if isinstance(result, str) else result[0]
+                break
+
+        self.rebuild()
+        self.color = Color.BLACK if self.color == Color.WHITE else Color.WHITE
+        return self.record
+
+    def state(self) -> tuple:
+        # Reading an empty place inserts None into the `defaultdict`.
+        data = [(place, piece) for place, piece in self.data.items() if piece]
+        return self.color, sorted(data)
+
+    def game_over(self) -> Winner:
+        """Judge whether a King has been captured (the draw rules are not used)."""
+        kings = {
+            piece.color
+            for piece in self.pieces
+            if piece.name == Name.KING and piece.squares
+        }
+        if len(kings) == 2:
+            return Winner.NULL
+        elif Color.WHITE in kings:
+            return Winner.WHITE
+        elif Color.BLACK in kings:
+            return Winner.BLACK
+        return Winner.DRAW
+
+
+class OptimizedEngine(Engine):
+    """
+    The chessboard as used by the agents:
+    cached and packed actions, incremental updates by `push`
+    and copy-on-write copies.
+    """
+
+    def __init__(self, pieces: list, seed: int) -> None:
+        self.chessboard = ChessBoard(Game(copy.deepcopy(pieces)), seed)
+        self.plies = 0
+
+    def actions(self) -> set:
+        chessboard = self.chessboard
+        decode = chessboard.decode_action
+        return {decode(code) for code in chessboard.actions(encoded=True)}
+
+    def move(self, action: Tuple[Tuple, Tuple]) -> str:
+        self.chessboard.push(ChessBoard.encode_action(*action))
+        # Copy sometimes, so that shared pieces are also exercised.
+        self.plies += 1
+        if self.plies % 3 == 0:
+            self.chessboard = self.chessboard.copy()
+        return self.chessboard.record
+
+    def state(self) -> tuple:
+        chessboard = self.chessboard
+        return chessboard.color, sorted(chessboard.data.items())
+
+
+def normalize(actions: set) -> set:
+    """
+    Sort the sources of merge movements,
+    since the same position may list them in either order.
+    """
+    return {(tuple(sorted(source)), target) for source, target in actions}
+
+
+def play(
+    actions: List[Tuple[Tuple, Tuple]],
+    seed: int,
+    reference: type = ReferenceEngine,
+    candidate: type = OptimizedEngine,
+    pieces: list = standard,
+) -> Optional[Tuple[int, str]]:
+    """
+    Replay the actions with both engines and compare them after each action.
+
+    Notes
+    -----
+    Both engines see the same measurement results,
+    since the random generators of both chessboards are seeded with `seed`.
+
+    Returns
+    -------
+    divergence : tuple, optional
+        The number of actions needed to show the difference
+        and the description of the difference,
+        or None if they agree on all the actions.
+        An action that is not possible for the reference is also reported,
+        so that the caller can tell a shorter sequence is not valid.
+
+    """
+    engines = [reference(pieces, seed), candidate(pieces, seed)]
+    for ply in range(len(actions) + 1):
+        expected, actual = [engine.actions() for engine in engines]
+        if normalize(expected) != normalize(actual):
+            missing = sorted(map(repr, normalize(expected) - normalize(actual)))
+            extra = sorted(map(repr, normalize(actual) - normalize(expected)))
+            return ply, f"actions differ: missing {missing}, extra {extra}"
+        if ply == len(actions):
+            break
+
+        action = actions[ply]
+        if action not in expected:
+            return ply, f"invalid action {action}"
+
+        records = [engine.move(action) for engine in engines]
+        if records[0] != records[1]:
+            return ply + 1, f"records differ: {records[0]!r} != {records[1]!r}"
+
+        expected, actual = [engine.state() for engine in engines]
+        if expected != actual:
+            return ply + 1, f"chessboards differ: {expected} != {actual}"
+
+    return None
+
+
+def generate(seed: int, plies: int, pieces: list = standard) -> list:
+    """
+    Generate a random game of at most `plies` actions with the reference engine,
+    whose measurements are seeded with `seed`.
+    """
+    choice = random.Random(seed)
+    engine = ReferenceEngine(pieces, seed)
+    actions = []
+    for _ in range(plies):
+        if engine.game_over():
+            break
+        candidates = sorted(engine.actions(), key=repr)
+        if not candidates:
+            break
+        actions.append(choice.choice(candidates))
+        engine.move(actions[-1])
+    return actions
+
+
+def minimize(actions: list, seed: int, **kwargs) -> list:
+    """
+    Shorten a diverging action sequence while it still diverges.
+
+    Notes
+    -----
+    The sequence is first cut after the divergence,
+    then each pair of successive actions and each action
+    is removed in turn if the rest still diverges
+    (the rest must still be valid for the reference engine),
+    until no more actions can be removed.
+
+    """
+    result = play(actions, seed, **kwargs)
+    if result is None:
+        return actions
+    actions = actions[: result[0]]
+
+    # Repeat until no action can be removed.
+    # Removing two successive actions keeps whose turn it is,
+    # so it usually works when removing only one does not.
+    changed = True
+    while changed:
+        changed = False
+        for size in (2, 1):
+            index = len(actions) - size
+            while index >= 0:
+                shorter = actions[:index] + actions[index + size :]
+                result = play(shorter, seed, **kwargs)
+                if result is not None and not result[1].startswith("invalid"):
+                    actions = shorter[: result[0]]
+                    index = min(index, len(actions) - size + 1)
+                    changed = True
+                index -= 1
+    return actions
+
+
+def fuzz(
+    games: int, plies: int, seed: int = 0, **kwargs
+) -> Optional[Tuple[int, list, str]]:
+    """
+    Play random games and compare the engines after each action.
+
+    Returns
+    -------
+    divergence : tuple, optional
+        The seed of the first diverging game,
+        its minimized action sequence and the description of the difference,
+        or None if no divergence is found.
+
+    """
+    for game in range(seed, seed + games):
+        actions = generate(game, plies, kwargs.get("pieces", standard))
+        result = play(actions, game, **kwargs)
+        if result is not None:
+            actions = minimize(actions, game, **kwargs)
+            return game, actions, play(actions, game, **kwargs)[1]
+
+    return None
+
+
+@click.command()
+@click.option("-n", "--games", help="Number of games.", type=int, default=100)
+@click.option("-p", "--plies", help="Maximum number of plies.", type=int, default=80)
+@click.option("-s", "--seed", help="Seed of the first game.", type=int, default=0)
+def main(games: int, plies: int, seed: int) -> None:
+    result = fuzz(games, plies, seed)
+    if result is None:
+        click.echo(f"No divergence found in {games} games.")
+        return
+
+    game, actions, description = result
+    click.echo(f"Game {game} diverges after {len(actions)} actions:")
+    for action in actions:
+        click.echo(f"    {action}")
+    click.echo(description)
+    raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
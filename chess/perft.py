@@ -0,0 +1,171 @@
+# Author       : czy
+# Description  : Perft, counting the leaf nodes of the game tree
+#                to test and measure move generation.
+#
+# Copyright 2022 Zhiyuan Chen <chenzhiyuan@mail.ustc.edu.cn>
+
+import time
+from collections import Counter
+from typing import Dict, Tuple
+
+import click
+
+from chess.chessboard import ChessBoard
+from chess.constant import Color, Name
+from chess.game import Game
+from chess.rule import (
+    ActionRule,
+    AttackActionRule,
+    CastlingActionRule,
+    MeetActionRule,
+    MergeMoveActionRule,
+    MoveActionRule,
+    SplitMoveActionRule,
+)
+
+# The kind of the actions performed by each rule.
+KINDS = {
+    MoveActionRule: "move",
+    AttackActionRule: "capture",
+    CastlingActionRule: "castle",
+    SplitMoveActionRule: "split",
+    MergeMoveActionRule: "merge",
+    MeetActionRule: "meet",
+}
+
+
+def kind(chessboard: ChessBoard, action: Tuple[Tuple, Tuple]) -> str:
+    """
+    Get the kind of an action, determined by the rule it matches.
+
+    Returns
+    -------
+    kind : str
+        One of `move`, `capture`, `castle`, `split`, `merge`, `meet`
+        and `promotion` (a pawn moving to the last row),
+        the name of the rule for other rules,
+        or `none` if no rule matches.
+
+    """
+    source, target = action
+    piece = chessboard.get_piece(source)
+    rule = ActionRule.dispatch(piece.color, piece.name, source, target, chessboard.data)
+    if rule is None:
+        return "none"
+
+    if (
+        rule is MoveActionRule
+        and piece.name == Name.PAWN
+        and target[0][1] == (8 if piece.color == Color.WHITE else 1)
+    ):
+        return "promotion"
+    return KINDS.get(rule, rule.__name__)
+
+
+def count(chessboard: ChessBoard, depth: int) -> Counter:
+    """
+    Count the leaf nodes `depth` plies below the chessboard by kind,
+    where the kind of a leaf node is the kind of the last action.
+    Nodes where the game is over have no children,
+    and the chessboard itself is counted as `root` if `depth` is 0.
+    """
+    if depth <= 0:
+        return Counter(root=1)
+    if chessboard.game_over():
+        return Counter()
+
+    actions = chessboard.generate_actions(chessboard.color)
+    if depth == 1:
+        return Counter(kind(chessboard, action) for action in actions)
+
+    counter = Counter()
+    for action in actions:
+        counter += count(chessboard.push(action), depth - 1)
+        chessboard.pop()
+    return counter
+
+
+def perft(
+    chessboard: ChessBoard, depth: int, divide: bool = False, seed: int = 0
+) -> Dict:
+    """
+    Count the leaf nodes of the game tree by kind.
+
+    Notes
+    -----
+    Since actions may measure the pieces, the random generator
+    of the chessboard is seeded with `seed` before counting
+    (and restored afterwards),
+    so that the result of the same position is always the same.
+    The actions are always generated, bypassing `ChessBoard.cache`,
+    so that the time measures move generation
+    and a generation bug is not hidden by cached results.
+
+    Parameters
+    ----------
+    chessboard : ChessBoard
+        The root of the game tree. It is unchanged afterwards.
+    depth : int
+        The number of plies to look ahead.
+    divide : bool
+        If true, count the leaf nodes below each action of the root separately.
+    seed : int
+        The seed of the measurements.
+
+    Returns
+    -------
+    counter : Counter or dict
+        The number of leaf nodes of each kind,
+        or a dict from each action of the root to such a counter if `divide`.
+
+    """
+    state = chessboard.random.getstate()
+    chessboard.random.seed(seed)
+    try:
+        if not divide:
+            return count(chessboard, depth)
+
+        result = {}
+        for action in chessboard.generate_actions(chessboard.color):
+            if depth <= 1:
+                result[action] = Counter([kind(chessboard, action)])
+            else:
+                result[action] = count(chessboard.push(action), depth - 1)
+                chessboard.pop()
+        return result
+    finally:
+        chessboard.random.setstate(state)
+
+
+@click.command()
+@click.option("-d", "--depth", help="Number of plies.", type=int, default=2)
+@click.option("--divide", help="Count below each action.", is_flag=True)
+@click.option("-s", "--seed", help="Seed of the measurements.", type=int, default=0)
+@click.option("-g", "--game", help="Load the endgame with this id.", type=int)
+def main(depth: int, divide: bool, seed: int, game: int) -> None:
+    chessboard = ChessBoard(Game.load(game) if game is not None else Game())
+
+    start = time.perf_counter()
+    result = perft(chessboard, depth, divide, seed)
+    elapsed = time.perf_counter() - start
+
+    if divide:
+        total = Counter()
+        for (source, target), counter in result.items():
+            places = [ActionRule.place2str(place) for place in (*source, *target)]
+            click.echo(f"{' '.join(places)}: {sum(counter.values())}")
+            total += counter
+    else:
+        total = result
+
+    nodes = sum(total.values())
+    click.echo()
+    for name, number in sorted(total.items()):
+        click.echo(f"{name}: {number}")
+    click.echo(f"nodes: {nodes}")
+    click.echo(f"time: {elapsed:.3f}s")
+    click.echo(f"nps: {nodes / elapsed if elapsed > 0 else 0:.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -5,10 +5,12 @@
 # Copyright 2022 Zhiyuan Chen <chenzhiyuan@mail.ustc.edu.cn>
 
 import random
-from collections import defaultdict
-from typing import Iterator, List, Optional, Tuple
+import struct
+from typing import Iterable, Iterator, List, Optional, Set, Tuple
 
+from chess.bitboard import PLACES, BitBoard, square
 from chess.constant import Color, Name
+from chess.probability import ONE, PRECISION, to_fixed, to_float
 from chess.rule import *
 from chess.settings import setting
 
@@ -30,8 +32,25 @@ class Piece:
         and the last represents the probability of the chess piece
         appearing in this place.
 
+    Notes
+    -----
+    The places are stored as two parallel lists,
+    `squares` (square indices from 0 to 63) and `probabilities`,
+    where the probabilities are fixed-point (see `chess.probability`),
+    as are the probabilities taken and returned by `add`, `remove` and `get`.
+    `places` is still available as a property with float probabilities,
+    but it builds a new list each time,
+    so changing that list does not change the piece.
+    `kind` is the name the piece is created with, which decides its moving rule,
+    so a promoted pawn keeps moving like a pawn.
+
     """
 
+    __slots__ = ("color", "name", "kind", "squares", "probabilities")
+
+    # Moving rules shared by all pieces, indexed by the name of the piece.
+    _rules = {}
+
     def __init__(
         self,
         color: Color,
@@ -41,10 +60,41 @@ class Piece:
 
         self.color = color
         self.name = name
+        self.kind = name
         self.places = places
 
-        # Different types of pieces have different moving rules.
-        self.rule = eval(f"{setting.rules[self.name.value]}()")
+    @property
+    def places(self) -> List[Tuple[int, int, float]]:
+        """The (column, row, probability) places of the piece."""
+        return [
+            (sq % 8 + 1, sq // 8 + 1, to_float(p))
+            for sq, p in zip(self.squares, self.probabilities)
+        ]
+
+    @places.setter
+    def places(self, places: Iterable[Tuple[int, int, float]]) -> None:
+        self.squares = []
+        self.probabilities = []
+        for p in places:
+            self.squares.append(square(p))
+            self.probabilities.append(to_fixed(p[2]))
+
+    @property
+    def rule(self) -> MoveRule:
+        """
+        Different types of pieces have different moving rules.
+        Since rules are stateless, one rule is shared by all pieces of a type.
+        """
+        return Piece.rule_of(self.kind)
+
+    @staticmethod
+    def rule_of(name: Name) -> MoveRule:
+        """Get the moving rule shared by all pieces of a type."""
+        rule = Piece._rules.get(name)
+        if rule is None:
+            rule = eval(f"{setting.rules[name.value]}()")
+            Piece._rules[name] = rule
+        return rule
 
     def __str__(self) -> str:
         """
@@ -58,41 +108,142 @@ class Piece:
         """Same as `__str__()`."""
         return self.__str__()
 
-    def add(self, place: Tuple[int, int, float]) -> None:
+    def copy(self) -> "Piece":
+        """Return a copy, whose places can be changed independently."""
+        piece = Piece.__new__(Piece)
+        piece.color = self.color
+        piece.name = self.name
+        piece.kind = self.kind
+        piece.squares = self.squares[:]
+        piece.probabilities = self.probabilities[:]
+        return piece
+
+    def pack(self) -> bytes:
+        """
+        Pack the piece into a few bytes.
+
+        Notes
+        -----
+        The first byte holds the color (bit 7), the name (bits 4-6)
+        and the number of places (bits 0-3, or 15 followed by a byte
+        holding the number if there are at least 15 places
+        or the kind is not the name, in which case its bit 7 is set
+        and it is followed by a byte holding the kind).
+        Each place takes one byte holding the square index (bits 0-5)
+        and the kind of probability (bits 6-7):
+        0 for 1, 1 for 2 ** -k followed by a byte k,
+        and 2 for any other probability followed by 8 bytes.
+        So the usual piece in one place with probability 1 takes 2 bytes,
+        and the exact fixed-point values are restored by `unpack`.
+
+        """
+        count = len(self.squares)
+        head = self.color.value << 7 | self.name.value << 4
+        if self.kind != self.name:
+            data = bytearray([head | 15, 1 << 7 | count, self.kind.value])
+        elif count < 15:
+            data = bytearray([head | count])
+        else:
+            data = bytearray([head | 15, count])
+        for sq, p in zip(self.squares, self.probabilities):
+            if p == ONE:
+                data.append(sq)
+            elif p > 0 and p & (p - 1) == 0:
+                data += bytes([1 << 6 | sq, PRECISION - p.bit_length() + 1])
+            else:
+                data += bytes([2 << 6 | sq]) + struct.pack("<Q", p)
+        return bytes(data)
+
+    @staticmethod
+    def unpack(data: bytes, offset: int = 0) -> Tuple["Piece", int]:
+        """
+        Unpack a piece packed by `pack` from `data` at `offset`.
+
+        Returns
+        -------
+        piece : Piece
+            The piece.
+        offset : int
+            The offset after the piece.
+
+        """
+        head = data[offset]
+        offset += 1
+        piece = Piece.__new__(Piece)
+        piece.color = Color(head >> 7)
+        piece.name = piece.kind = Name(head >> 4 & 7)
+
+        count = head & 15
+        if count == 15:
+            count = data[offset]
+            offset += 1
+            if count >> 7:
+                count &= 127
+                piece.kind = Name(data[offset])
+                offset += 1
+
+        piece.squares = []
+        piece.probabilities = []
+        for _ in range(count):
+            byte = data[offset]
+            kind = byte >> 6
+            offset += 1
+            if kind == 0:
+                p = ONE
+            elif kind == 1:
+                p = ONE >> data[offset]
+                offset += 1
+            else:
+                p = struct.unpack_from("<Q", data, offset)[0]
+                offset += 8
+            piece.squares.append(byte & 63)
+            piece.probabilities.append(p)
+        return piece, offset
+
+    def add(self, place: Tuple[int, int, int]) -> None:
         """Add a possible place."""
-        self.places.append(place)
+        self.squares.append(square(place))
+        self.probabilities.append(place[2])
 
-    def remove(self, place: Tuple[int, int]) -> Optional[Tuple[int, int, float]]:
+    def remove(self, place: Tuple[int, int]) -> Optional[Tuple[int, int, int]]:
         """Delete and return to a possible place."""
-        for p in self.places:
-            if p[:2] == place:
-                val = p
-                self.places.remove(p)
-                return val
-        else:
+        sq = square(place)
+        if sq not in self.squares:
             return None
 
+        i = self.squares.index(sq)
+        del self.squares[i]
+        return (place[0], place[1], self.probabilities.pop(i))
+
     def clear(self) -> None:
         """
         Empty all possible positions.
         In fact, it means that the chess piece has been eaten.
         """
-        self.places = []
+        self.squares = []
+        self.probabilities = []
 
     def find(self, place: Tuple[int, int]) -> bool:
         """Judge whether the piece may appear in a certain place."""
-        return any([p[:2] == place for p in self.places])
+        return square(place) in self.squares
+
+    def find_square(self, sq: int) -> bool:
+        """Same as `find`, but for a square index."""
+        return sq in self.squares
 
     def get(self, place: Tuple[int, int]) -> float:
         """Get the probability that the piece appears in a certain place."""
-        for p in self.places:
-            if p[:2] == place:
-                return p[2]
+        return self.get_square(square(place))
+
+    def get_square(self, sq: int) -> float:
+        """Same as `get`, but for a square index."""
+        if sq in self.squares:
+            return self.probabilities[self.squares.index(sq)]
         else:
             return 0
 
     def next(
-        self, selected: List[Tuple[int, int]], data: defaultdict
+        self, selected: List[Tuple[int, int]], data: BitBoard
     ) -> Iterator[Tuple]:
         """
         Generate the next possible action according to the type of the piece.
@@ -101,7 +252,11 @@ class Piece:
         for step in self.rule.next(self.color, selected, data):
             yield (step,)
 
-    def measure(self) -> Optional[Tuple[int, int]]:
+    def next_squares(self, selected: int, data: BitBoard) -> Iterator[int]:
+        """Same as `next`, but for square indices."""
+        return self.rule.next_squares(self.color, selected, data)
+
+    def measure(self, rng: random.Random = random) -> Optional[Tuple[int, int]]:
         """
         Measure the piece.
 
@@ -113,6 +268,13 @@ class Piece:
         which means that the state of the chess piece 
         will change after measurement.
 
+        Parameters
+        ----------
+        rng : random.Random, optional
+            The random generator to draw from,
+            usually that of the chessboard (see `Rule.rng`).
+            By default the global one is used.
+
         Returns
         -------
         place : tuple, optional
@@ -122,16 +284,153 @@ class Piece:
             the piece may not exist after the measurement.
 
         """
-        probability = random.random()
-        random.shuffle(self.places)
-        for place in self.places:
-            probability -= place[2]
-            if probability < 1e-6:
-                self.places = [(place[0], place[1], 1)]
-                return (place[0], place[1])
+        # `random.random()` is a multiple of 2 ** -53,
+        # so it is converted to fixed point exactly.
+        probability = to_fixed(rng.random())
+        places = list(zip(self.squares, self.probabilities))
+        rng.shuffle(places)
+        self.squares = [sq for sq, _ in places]
+        self.probabilities = [p for _, p in places]
+        for sq, p in places:
+            probability -= p
+            if probability < 0:
+                self.squares = [sq]
+                self.probabilities = [ONE]
+                return PLACES[sq]
 
         return None
 
     def superposed(self) -> bool:
         """Judge whether the piece can appear in multiple positions."""
-        return not (len(self.places) == 1 and self.places[0][2] == 1)
+        return not (len(self.squares) == 1 and self.probabilities[0] == ONE)
+
+    def compact(self, width: int = 0, floor: int = 0) -> Set[int]:
+        """
+        Compact the places of the piece.
+
+        Notes
+        -----
+        Places on the same square are merged into the first of them.
+        Then, while there are more than `width` places (if `width` is not 0)
+        or a place has a probability below `floor`,
+        the least probable place is dropped and its probability is spread
+        over the other places in proportion to their probabilities
+        (the rounding remainder goes to the most probable one),
+        so the total probability of the piece is unchanged.
+        A piece in one place is never changed.
+
+        Parameters
+        ----------
+        width : int, optional
+            The maximum number of places, or 0 for no limit.
+        floor : int, optional
+            The minimum fixed-point probability of a place.
+
+        Returns
+        -------
+        squares : set of int
+            The squares whose probability has changed, including removed ones.
+
+        """
+        squares = self.squares
+        probabilities = self.probabilities
+        changed = set()
+        if len(squares) <= 1:
+            return changed
+
+        if len(set(squares)) < len(squares):
+            merged = {}
+            for sq, p in zip(squares, probabilities):
+                if sq in merged:
+                    changed.add(sq)
+                merged[sq] = merged.get(sq, 0) + p
+            squares[:] = merged.keys()
+            probabilities[:] = merged.values()
+
+        while len(squares) > 1 and (
+            (width and len(squares) > width) or min(probabilities) < floor
+        ):
+            i = probabilities.index(min(probabilities))
+            changed.add(squares.pop(i))
+            p = probabilities.pop(i)
+            total = sum(probabilities)
+            rest = p
+            if total > 0:
+                for j, q in enumerate(probabilities):
+                    share = p * q // total
+                    probabilities[j] += share
+                    rest -= share
+            probabilities[probabilities.index(max(probabilities))] += rest
+            changed.update(squares)
+        return changed
+
+
+class PieceList(list):
+    """
+    List of pieces with a square-to-piece index.
+
+    Notes
+    -----
+    `owners[i]` holds the indices (in ascending order) of the pieces
+    that may appear on square `i`.
+    `occupancy[i]` is the probability of the first of these pieces
+    that appears on square `i`, or 0 if there is none,
+    the same as `probability_square(i)`.
+
+    Both are maintained by the chessboard after each action,
+    so during an action they may be out of date for the changed pieces.
+    Lookups therefore confirm each candidate with `Piece.find`.
+
+    `random` is the random generator of the measurements of the chessboard,
+    or None to use the global one.
+
+    """
+
+    def __init__(self, pieces: Iterable[Piece] = ()) -> None:
+        super().__init__(pieces)
+        self.owners = [()] * 64
+        self.occupancy = [0] * 64
+        self.random = None
+
+    def copy(self) -> "PieceList":
+        """
+        Return a shallow copy, which shares the pieces with self
+        but has its own square-to-piece index and random generator.
+        """
+        pieces = PieceList(self)
+        pieces.owners = self.owners[:]
+        pieces.occupancy = self.occupancy[:]
+        pieces.random = None if self.random is None else self.random.copy()
+        return pieces
+
+    def find(self, *places: Tuple[int, int]) -> Optional[Piece]:
+        """
+        Find the first piece that may appear in all the places.
+        (Due to the split movement, a chess piece may be in multiple positions.)
+        """
+        return self.find_square(*[square(place) for place in places])
+
+    def find_square(self, *squares: int) -> Optional[Piece]:
+        """Same as `find`, but for square indices."""
+        for index in self.owners[squares[0]]:
+            piece = self[index]
+            if all([sq in piece.squares for sq in squares]):
+                return piece
+        else:
+            return None
+
+    def probability(self, place: Tuple[int, int]) -> float:
+        """
+        Get the probability that the first piece
+        which may appear in a certain place appears there.
+        """
+        return self.probability_square(square(place))
+
+    def probability_square(self, sq: int) -> float:
+        """Same as `probability`, but for a square index."""
+        for index in self.owners[sq]:
+            p = self[index].get_square(sq)
+            if p > 0:
+                return p
+        else:
+            return 0
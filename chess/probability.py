@@ -0,0 +1,21 @@
+# Author       : czy
+# Description  : Fixed-point probabilities of quantum places.
+#
+# Copyright 2022 Zhiyuan Chen <chenzhiyuan@mail.ustc.edu.cn>
+
+# Probabilities are stored as integers in units of 2 ** -PRECISION.
+# Splitting halves a probability, and merging or moving adds and subtracts
+# them, so they stay exact until a piece has been split PRECISION times.
+PRECISION = 60
+# The probability 1.
+ONE = 1 << PRECISION
+
+
+def to_fixed(probability: float) -> int:
+    """Convert a probability to the nearest fixed-point integer."""
+    return round(probability * ONE)
+
+
+def to_float(probability: int) -> float:
+    """Convert a fixed-point probability to a float."""
+    return probability / ONE
@@ -0,0 +1,99 @@
+# Author       : czy
+# Description  : Seedable random generator of the measurements.
+#
+# Copyright 2022 Zhiyuan Chen <chenzhiyuan@mail.ustc.edu.cn>
+
+import hashlib
+import os
+import random
+from typing import Any, Optional, Tuple
+
+from chess.zobrist import MASK, mix
+
+# The increment of SplitMix64.
+GOLDEN = 0x9E3779B97F4A7C15
+
+
+class MeasureRandom(random.Random):
+    """
+    Counter-based random generator (SplitMix64) of the measurements.
+
+    Parameters
+    ----------
+    seed : int, str, bytes or bytearray, optional
+        The seed. If it is None, a random seed is chosen.
+
+    Notes
+    -----
+    The `n`-th draw only depends on the seed and `n`,
+    so the whole state is the (seed, counter) pair,
+    which is cheap to save, restore and store with a game.
+    The methods of `random.Random` (such as `shuffle`) are built on it.
+
+    """
+
+    def __init__(self, seed: Optional[Any] = None) -> None:
+        super().__init__(seed)
+
+    def seed(self, a: Optional[Any] = None, version: int = 2) -> None:
+        """
+        Start again from the seed `a` (a random one if it is None).
+
+        Notes
+        -----
+        An int is folded into 64 bits by xor of its 64-bit words
+        (its sign is folded as one more word),
+        so an int below 2 ** 64 is used as it is.
+        Other seeds are hashed by SHA-512 like `random.Random`,
+        str and bytes by their content, others by their `repr`.
+
+        """
+        if a is None:
+            a = int.from_bytes(os.urandom(8), "little")
+        if isinstance(a, int):
+            key = 0
+            if a < 0:
+                a, key = -a, MASK
+            while a:
+                key ^= a & MASK
+                a >>= 64
+        else:
+            if isinstance(a, str):
+                a = a.encode()
+            elif not isinstance(a, (bytes, bytearray)):
+                a = repr(a).encode()
+            key = int.from_bytes(hashlib.sha512(a).digest()[:8], "little")
+        self.key = key
+        self.counter = 0
+        self.gauss_next = None
+
+    def getstate(self) -> Tuple[int, int]:
+        """Return the (seed, counter) state."""
+        return self.key, self.counter
+
+    def setstate(self, state: Tuple[int, int]) -> None:
+        """Restore the state returned by `getstate`."""
+        self.key, self.counter = state
+        self.gauss_next = None
+
+    def copy(self) -> "MeasureRandom":
+        """Return a generator with the same state, which draws independently."""
+        rng = MeasureRandom.__new__(MeasureRandom)
+        rng.setstate(self.getstate())
+        return rng
+
+    def next(self) -> int:
+        """Draw 64 random bits."""
+        self.counter += 1
+        return mix((self.key + self.counter * GOLDEN) & MASK)
+
+    def random(self) -> float:
+        """Draw a float in [0, 1), a multiple of 2 ** -53."""
+        return (self.next() >> 11) * 2.0 ** -53
+
+    def getrandbits(self, k: int) -> int:
+        """Draw an integer of `k` random bits."""
+        bits = 0
+        for i in range(0, k, 64):
+            bits |= self.next() << i
+        return bits & ((1 << k) - 1)
@@ -3,11 +3,14 @@
 #
 # Copyright 2022 Zhiyuan Chen <chenzhiyuan@mail.ustc.edu.cn>
 
-from collections import defaultdict
+import random
+from bisect import bisect_right
 from itertools import combinations
-from typing import Iterator, List, Optional, Tuple
+from typing import Iterator, List, Optional, Set, Tuple
 
-from chess.constant import Color, Name, State
+from chess.bitboard import BETWEEN, PLACES, BitBoard, square
+from chess.constant import Color, Name, Occupancy, State
+from chess.probability import ONE
 
 
 class Rule:
@@ -24,12 +27,68 @@ class Rule:
         Find the pieces that may appear
         in the specified place in the list of pieces.
         """
+        # Use the square-to-piece index of `PieceList` if possible.
+        if hasattr(pieces, "owners"):
+            return pieces.find_square(square(place))
+
         for piece in pieces:
             if piece.find(place):
                 return piece
         else:
             return None
 
+    @classmethod
+    def rng(cls, pieces: list) -> random.Random:
+        """
+        Get the random generator of the measurements:
+        that of `PieceList` if possible, otherwise the global one.
+        """
+        return getattr(pieces, "random", None) or random
+
+    @classmethod
+    def owners(cls, place: Tuple[int, int], pieces: list) -> list:
+        """Find all the pieces that may appear in the specified place."""
+        # Use the square-to-piece index of `PieceList` if possible.
+        if hasattr(pieces, "owners"):
+            sq = square(place)
+            pieces = [pieces[index] for index in pieces.owners[sq]]
+            return [piece for piece in pieces if piece.find_square(sq)]
+        return [piece for piece in pieces if piece.find(place)]
+
+
+def build_table(moves: list) -> List[List[List[Tuple[int, Tuple[int, int]]]]]:
+    """
+    Precompute the squares reachable by `moves` from each square.
+
+    Parameters
+    ----------
+    moves : list
+        List of possible moves, in the same format as `MoveRule.moves`.
+
+    Returns
+    -------
+    table : list
+        The index is a square index, and the value is the list of rays from it.
+        Each ray is the list of (square index, place) along one move,
+        clipped to the chessboard. Empty rays are dropped.
+
+    """
+    table = []
+    for col, row in PLACES:
+        rays = []
+        for move in moves:
+            ray = []
+            for step in move:
+                next = (col + step[0], row + step[1])
+                # If it crosses the boundary, the rest of the ray is discarded.
+                if Rule.overstep(next):
+                    break
+                ray.append((square(next), next))
+            if ray:
+                rays.append(ray)
+        table.append(rays)
+    return table
+
 
 class MoveRule(Rule):
     """
@@ -39,6 +98,39 @@ class MoveRule(Rule):
 
     # List of possible moves.
     moves = []
+    # Rays of `moves` from each place, built when the subclass is defined.
+    table = build_table(moves)
+
+    def __init_subclass__(cls, **kwargs) -> None:
+        """Precompute the table of `moves` for each subclass."""
+        super().__init_subclass__(**kwargs)
+        cls.table = build_table(cls.moves)
+
+    @classmethod
+    def rays(cls, color: Color, selected: int) -> List[List[Tuple[int, Tuple]]]:
+        """Get the precomputed rays from the selected square index."""
+        return cls.table[selected]
+
+    @classmethod
+    def attacks(cls, color: Color, selected: int, data: BitBoard) -> int:
+        """
+        Get the mask of the squares attacked from the selected square index,
+        that is, where the piece could capture an opponent's piece.
+
+        Notes
+        -----
+        Like `check`, only pieces that are certainly there block the way.
+        The square of the blocking piece is attacked (or defended) as well.
+
+        """
+        mask = 0
+        for ray in cls.rays(color, selected):
+            for sq, _ in ray:
+                mask |= 1 << sq
+                piece = data.at(sq)
+                if piece is not None and piece[2] == ONE:
+                    break
+        return mask
 
     @classmethod
     def check(
@@ -46,7 +138,7 @@ class MoveRule(Rule):
         color: Color,
         cur: Tuple[int, int],
         next: Tuple[int, int],
-        piece: Optional[Tuple[Color, Name, float]],
+        piece: Optional[Tuple[Color, Name, int]],
     ) -> State:
         """
         Check whether a specific movement is legal.
@@ -79,7 +171,7 @@ class MoveRule(Rule):
         """
 
         # No obstacles or cccupy the space in superposition state
-        if piece is None or 1 - piece[2] > 1e-6:
+        if piece is None or piece[2] != ONE:
             return State.UNOCCUPIED
 
         # Eat the opponent's chess pieces
@@ -91,7 +183,7 @@ class MoveRule(Rule):
 
     @classmethod
     def next(
-        cls, color: Color, selected: List[Tuple[int, int]], data: defaultdict
+        cls, color: Color, selected: List[Tuple[int, int]], data: BitBoard
     ) -> Iterator[Tuple[int, int]]:
         """
         Generate the possible place of the next step according to `moves`.
@@ -102,7 +194,7 @@ class MoveRule(Rule):
             The color of the current player.
         selected : list of tuple
             Selected place.
-        data : defaultdict
+        data : BitBoard
             Chessboard data.
 
         Returns
@@ -111,23 +203,25 @@ class MoveRule(Rule):
             Next possible place.
 
         """
-        selected = selected[0]
+        for sq in cls.next_squares(color, square(selected[0]), data):
+            yield PLACES[sq]
 
-        for move in cls.moves:
-            for step in move:
-                next = (selected[0] + step[0], selected[1] + step[1])
-                # If it crosses the boundary, the place will be discarded.
-                if Rule.overstep(next):
-                    break
+    @classmethod
+    def next_squares(cls, color: Color, selected: int, data: BitBoard) -> Iterator[int]:
+        """Same as `next`, but for square indices."""
+        cur = PLACES[selected]
 
+        # The rays are already clipped to the chessboard.
+        for ray in cls.rays(color, selected):
+            for sq, next in ray:
                 # Check whether the place is legal.
-                piece = data[next]
-                state = cls.check(color, selected, next, piece)
+                piece = data.at(sq)
+                state = cls.check(color, cur, next, piece)
 
                 if state == State.UNOCCUPIED:
-                    yield next
+                    yield sq
                 elif state == State.REACHABLE:
-                    yield next
+                    yield sq
                     break
                 else:
                     break
@@ -152,6 +246,25 @@ class PawnMoveRule(MoveRule):
         [(1, -1)],
         [(-1, -1)],
     ]
+    # Pawns of each color only use their own half of `moves`.
+    tables = {Color.WHITE: build_table(moves[:4]), Color.BLACK: build_table(moves[4:])}
+    # Pawns only attack diagonally.
+    attack_tables = {
+        Color.WHITE: build_table(moves[2:4]),
+        Color.BLACK: build_table(moves[6:8]),
+    }
+
+    @classmethod
+    def rays(cls, color: Color, selected: int) -> List[List[Tuple[int, Tuple]]]:
+        return cls.tables[color][selected]
+
+    @classmethod
+    def attacks(cls, color: Color, selected: int, data: BitBoard) -> int:
+        mask = 0
+        for ray in cls.attack_tables[color][selected]:
+            for sq, _ in ray:
+                mask |= 1 << sq
+        return mask
 
     @classmethod
     def check(
@@ -159,7 +272,7 @@ class PawnMoveRule(MoveRule):
         color: Color,
         cur: Tuple[int, int],
         next: Tuple[int, int],
-        piece: Optional[Tuple[Color, Name, float]],
+        piece: Optional[Tuple[Color, Name, int]],
     ) -> State:
         # Can only move forward, not backward
         if color == Color.WHITE and cur[1] > next[1]:
@@ -176,7 +289,7 @@ class PawnMoveRule(MoveRule):
 
         if cur[0] == next[0]:
             # No obstacles or cccupy the space in superposition state
-            if not (piece is None or 1 - piece[2] > 1e-6):
+            if piece is not None and piece[2] == ONE:
                 return State.UNREACHABLE
         else:
             # Can only eat the opponent's chess pieces
@@ -206,7 +319,7 @@ class RookMoveRule(MoveRule):
         color: Color,
         cur: Tuple[int, int],
         next: Tuple[int, int],
-        piece: Optional[Tuple[Color, Name, float]],
+        piece: Optional[Tuple[Color, Name, int]],
     ) -> State:
         state = MoveRule.check(color, cur, next, piece)
         # Castling
@@ -215,7 +328,7 @@ class RookMoveRule(MoveRule):
             and state == State.UNREACHABLE
             and piece[0] == color
             and piece[1] == Name.KING
-            and piece[2] == 1
+            and piece[2] == ONE
             and next[0] == 5
             and (cur[0] == 1 or cur[0] == 8)
             and cur[1] == (1 if color == Color.WHITE else 8)
@@ -249,10 +362,10 @@ class KnightMoveRule(MoveRule):
         color: Color,
         cur: Tuple[int, int],
         next: Tuple[int, int],
-        piece: Optional[Tuple[Color, Name, float]],
+        piece: Optional[Tuple[Color, Name, int]],
     ) -> State:
         # If the place is occupied by one's own chess pieces, can't reach it
-        if piece and piece[0] == color and piece[2] == 1:
+        if piece and piece[0] == color and piece[2] == ONE:
             return State.UNREACHABLE
         return State.REACHABLE
 
@@ -315,8 +428,16 @@ class SpecialMoveRule(Rule):
     """
     SpecialMoveRule describes special movements
     with multiple sources or targets.
+
+    Notes
+    -----
+    Subclasses override at least one of `transform` and `generate`.
+
     """
 
+    # Name of the stage of `ChessBoard.iter_actions` yielding these movements.
+    stage = None
+
     @classmethod
     def transform(cls, actions: list, pieces: list) -> list:
         """
@@ -335,14 +456,45 @@ class SpecialMoveRule(Rule):
             New action list.
 
         """
-        return NotImplemented
+        actions.extend(list(cls.generate(actions, pieces)))
+        return actions
+
+    @classmethod
+    def generate(cls, actions: list, pieces: list) -> Iterator[Tuple[Tuple, Tuple]]:
+        """
+        Lazily generate only the new special movements.
+
+        Parameters
+        ----------
+        actions : list
+            List of possible actions.
+        pieces : list
+            Chess list.
+
+        Returns
+        -------
+        action : tuple
+            New special movement.
+
+        """
+        return iter(cls.transform(list(actions), pieces)[len(actions) :])
 
 
 class SplitMove(SpecialMoveRule):
     """Split movement."""
 
+    stage = "splits"
+
     @classmethod
-    def transform(cls, actions: list, pieces: list) -> list:
+    def generate(cls, actions: list, pieces: list) -> Iterator[Tuple[Tuple, Tuple]]:
+        # Each place is looked up only once.
+        cache = {}
+
+        def find(place: Tuple[int, int]) -> object:
+            if place not in cache:
+                cache[place] = cls.find(place, pieces)
+            return cache[place]
+
         src_dict = {}
         for source, target in actions:
             # It only works on ordinary movements
@@ -351,14 +503,14 @@ class SplitMove(SpecialMoveRule):
                 continue
 
             # Pawn can't split move
-            src_piece = cls.find(source[0], pieces)
+            src_piece = find(source[0])
             if src_piece.name == Name.PAWN:
                 continue
 
             if source[0] not in src_dict:
                 src_dict[source[0]] = []
 
-            dst_piece = cls.find(target[0], pieces)
+            dst_piece = find(target[0])
             # Can only split to space unoccupied or occupied by similar pieces
             if (not dst_piece) or (
                 dst_piece.color == src_piece.color and dst_piece.name == src_piece.name
@@ -369,16 +521,25 @@ class SplitMove(SpecialMoveRule):
             # Combine possible targets.
             for dst1, dst2 in combinations(targets, 2):
                 if dst1 != dst2:
-                    actions.append(((source,), (dst1, dst2)))
-
-        return actions
+                    yield ((source,), (dst1, dst2))
 
 
 class MergeMove(SpecialMoveRule):
     """Merge movement."""
 
+    stage = "merges"
+
     @classmethod
-    def transform(cls, actions: list, pieces: list) -> list:
+    def generate(cls, actions: list, pieces: list) -> Iterator[Tuple[Tuple, Tuple]]:
+        # Each place is looked up only once.
+        cache = {}
+
+        def find(place: Tuple[int, int]) -> object:
+            if place not in cache:
+                cache[place] = cls.find(place, pieces)
+            return cache[place]
+
+        owners = {}
         dst_dict = {}
         for source, target in actions:
             # It only works on ordinary movements
@@ -386,22 +547,33 @@ class MergeMove(SpecialMoveRule):
             if len(source) > 1 or len(target) > 1:
                 continue
 
+            # Can only be merged into space unoccupied
+            if find(target[0]) is not None:
+                continue
+
             if target[0] not in dst_dict:
                 dst_dict[target[0]] = []
 
             dst_dict[target[0]].append(source[0])
+            if source[0] not in owners:
+                owners[source[0]] = cls.owners(source[0], pieces)
 
-        # Can only be merged into space unoccupied
         for target, sources in dst_dict.items():
-            dst_piece = cls.find(target, pieces)
-            # Combine possible targets.
-            for src1, src2 in combinations(sources, 2):
-                # Only homologous pieces can be merged
-                src_piece = cls.find(src1, pieces)
-                if src_piece.find(src2) and dst_piece is None and src1 != src2:
-                    actions.append(((src1, src2), (target,)))
-
-        return actions
+            # Only homologous pieces can be merged, so the positions
+            # of the sources are grouped by the pieces that may appear there.
+            groups = {}
+            for index, source in enumerate(sources):
+                for piece in owners[source]:
+                    groups.setdefault(id(piece), []).append(index)
+
+            # Combine possible sources in the original order,
+            # only visiting the later sources of the same piece.
+            for index, src1 in enumerate(sources):
+                group = groups[id(find(src1))]
+                for later in group[bisect_right(group, index) :]:
+                    src2 = sources[later]
+                    if src1 != src2:
+                        yield ((src1, src2), (target,))
 
 
 class ActionRule(Rule):
@@ -409,8 +581,82 @@ class ActionRule(Rule):
     Base class for all action rule classes.
     Its subclasses specify how to deal with a specific action
     from source to target.
+
+    Notes
+    -----
+    `shape` and `occupancy` narrow down the actions a rule may match,
+    so that `dispatch` only checks the `condition` of a few rules.
+    Subclasses that do not set them are checked for every action.
+
     """
 
+    # The (number of sources, number of targets) matched, None for any.
+    shape = None
+    # The occupancies of the first target matched, None for any.
+    occupancy = None
+
+    # Rules to check for each (shape, occupancy), built lazily.
+    _table = {}
+
+    def __init_subclass__(cls, **kwargs) -> None:
+        """Rebuild the dispatch table when a new rule is registered."""
+        super().__init_subclass__(**kwargs)
+        ActionRule._table = {}
+
+    @classmethod
+    def occupy(cls, color: Color, place: Tuple[int, int], data: BitBoard) -> Occupancy:
+        """Classify the occupancy of a place for the player of `color`."""
+        piece = data[place]
+        if piece is None:
+            return Occupancy.EMPTY
+        elif piece[0] != color:
+            return Occupancy.ENEMY
+        elif piece[1] == Name.KING and piece[2] == ONE:
+            return Occupancy.OWN_KING
+        else:
+            return Occupancy.OWN
+
+    @classmethod
+    def dispatch(
+        cls,
+        color: Color,
+        name: Name,
+        source: Tuple[Tuple[int, int]],
+        target: Tuple[Tuple[int, int]],
+        data: BitBoard,
+    ) -> Optional["ActionRule"]:
+        """
+        Find the rule matching the action from source to target.
+
+        Notes
+        -----
+        All subclasses of ActionRule constitute the rules of movement.
+        The candidates are looked up by the shape of the action
+        and the occupancy of the target,
+        and then the first one whose `condition` holds is returned.
+
+        Returns
+        -------
+        rule : ActionRule, optional
+            The matching rule, or None if no rule matches.
+
+        """
+        key = ((len(source), len(target)), cls.occupy(color, target[0], data))
+        rules = ActionRule._table.get(key)
+        if rules is None:
+            rules = ActionRule._table[key] = [
+                rule
+                for rule in ActionRule.__subclasses__()
+                if (rule.shape is None or rule.shape == key[0])
+                and (rule.occupancy is None or key[1] in rule.occupancy)
+            ]
+
+        for rule in rules:
+            if rule.condition(color, name, source, target, data):
+                return rule
+        else:
+            return None
+
     @classmethod
     def place2str(cls, place: Tuple[int, int]) -> str:
         """Converts the place to a string for logging."""
@@ -429,14 +675,32 @@ class ActionRule(Rule):
         }
         return mapping[piece.name]
 
+    @classmethod
+    def places(cls, *pieces: object) -> Set[Tuple[int, int]]:
+        """
+        Get all the places where the pieces may appear.
+        Actions use it to report the places they touch.
+        """
+        return {PLACES[sq] for piece in pieces if piece for sq in piece.squares}
+
     @classmethod
     def obstacle(
         cls, source: Tuple[int, int], target: Tuple[int, int], pieces: list
-    ) -> float:
+    ) -> int:
         """
         Calculate the probability of encountering obstacles on the way
         from the source to the target.
         """
+        # Use the occupancy probabilities of `PieceList` if possible.
+        # The knight will not encounter obstacles,
+        # since there are no squares between its source and target.
+        if hasattr(pieces, "occupancy"):
+            occupancy = pieces.occupancy
+            for sq in BETWEEN[square(source)][square(target)]:
+                if occupancy[sq] > 0:
+                    return occupancy[sq]
+            return 0
+
         vec = (target[0] - source[0], target[1] - source[1])
         # The knight will not encounter obstacles
         if vec[0] != 0 and vec[1] != 0 and abs(vec[0]) != abs(vec[1]):
@@ -468,7 +732,7 @@ class ActionRule(Rule):
         name: Name,
         source: Tuple[Tuple[int, int]],
         target: Tuple[Tuple[int, int]],
-        data: defaultdict,
+        data: BitBoard,
     ) -> bool:
         """
         Judge whether the action from source to target
@@ -484,7 +748,7 @@ class ActionRule(Rule):
             Location of the source.
         target : tuple
             Location of the target.
-        data : defaultdict
+        data : BitBoard
             Chessboard data.
 
         Returns
@@ -503,7 +767,7 @@ class ActionRule(Rule):
         source: Tuple[Tuple[int, int]],
         target: Tuple[Tuple[int, int]],
         pieces: list,
-    ) -> str:
+    ) -> Tuple[str, Set[Tuple[int, int]]]:
         """
         For the matching action, the pieces are processed.
 
@@ -525,6 +789,10 @@ class ActionRule(Rule):
         record : str
             Record of action,
             such as `Nb1-a3` (Knight moves from (2, 1) to (1, 3)).
+        places : set of tuple
+            All places whose pieces may have changed,
+            before or after the action.
+            The chessboard only updates these places.
 
         """
         return NotImplemented
@@ -533,6 +801,9 @@ class ActionRule(Rule):
 class MoveActionRule(ActionRule):
     """Action rule for simple mobile action."""
 
+    shape = (1, 1)
+    occupancy = (Occupancy.EMPTY,)
+
     @classmethod
     def condition(
         cls,
@@ -540,7 +811,7 @@ class MoveActionRule(ActionRule):
         name: Name,
         source: Tuple[Tuple[int, int]],
         target: Tuple[Tuple[int, int]],
-        data: defaultdict,
+        data: BitBoard,
     ) -> bool:
         # There can only be one source and one target,
         # and there can be no piece at the target place.
@@ -554,28 +825,29 @@ class MoveActionRule(ActionRule):
         source: Tuple[Tuple[int, int]],
         target: Tuple[Tuple[int, int]],
         pieces: list,
-    ) -> str:
+    ) -> Tuple[str, Set[Tuple[int, int]]]:
         # Pawn promotion: Default to queen.
         promotion = name == Name.PAWN and target[0][1] == (
             8 if color == Color.WHITE else 1
         )
 
         piece = cls.find(source[0], pieces)
+        places = cls.places(piece) | {target[0]}
         if promotion:
             # promot success.
-            if piece.measure() == source[0]:
+            if piece.measure(cls.rng(pieces)) == source[0]:
                 piece.clear()
-                piece.add((*target[0], 1))
+                piece.add((*target[0], ONE))
                 piece.name = Name.QUEEN
 
-            return cls.place2str(target[0]) + "-Q"
+            return cls.place2str(target[0]) + "-Q", places
 
         # The moving record is like `a-b`.
         record = "-".join([cls.place2str(source[0]), cls.place2str(target[0])])
         record = cls.piece2str(piece) + record
 
         probability = piece.remove(source[0])[2]
-        if probability < 1:
+        if probability < ONE:
             piece.add((*target[0], probability))
         # Determine whether there are obstacles on the road.
         else:
@@ -583,16 +855,19 @@ class MoveActionRule(ActionRule):
             # Enter the superposition state when there are obstacles.
             if value > 0:
                 piece.add((*target[0], value))
-                piece.add((*source[0], 1 - value))
+                piece.add((*source[0], ONE - value))
             else:
                 piece.add((*target[0], probability))
 
-        return record
+        return record, places
 
 
 class AttackActionRule(ActionRule):
     """Action rule for eating piece."""
 
+    shape = (1, 1)
+    occupancy = (Occupancy.ENEMY,)
+
     @classmethod
     def condition(
         cls,
@@ -600,7 +875,7 @@ class AttackActionRule(ActionRule):
         name: Name,
         source: Tuple[Tuple[int, int]],
         target: Tuple[Tuple[int, int]],
-        data: defaultdict,
+        data: BitBoard,
     ) -> bool:
         piece = data[target[0]]
         # There is only one source and one target,
@@ -615,10 +890,11 @@ class AttackActionRule(ActionRule):
         source: Tuple[Tuple[int, int]],
         target: Tuple[Tuple[int, int]],
         pieces: list,
-    ) -> str:
+    ) -> Tuple[str, Set[Tuple[int, int]]]:
         # Measure before attacking the other party.
         piece = cls.find(source[0], pieces)
-        place = piece.measure()
+        places = cls.places(piece) | {target[0]}
+        place = piece.measure(cls.rng(pieces))
 
         # The attacking record is like `axb`.
         record = "x".join([cls.place2str(source[0]), cls.place2str(target[0])])
@@ -626,20 +902,23 @@ class AttackActionRule(ActionRule):
 
         # Do nothing if the measurement fails
         if place != source[0]:
-            return record
+            return record, places
 
         # If the measurement is successful, move to the new place
         cls.find(target[0], pieces).remove(target[0])
 
         piece.clear()
-        piece.add((*target[0], 1))
+        piece.add((*target[0], ONE))
 
-        return record
+        return record, places
 
 
 class CastlingActionRule(ActionRule):
     """Action rule for castling."""
 
+    shape = (1, 1)
+    occupancy = (Occupancy.OWN_KING,)
+
     @classmethod
     def condition(
         cls,
@@ -647,7 +926,7 @@ class CastlingActionRule(ActionRule):
         name: Name,
         source: Tuple[Tuple[int, int]],
         target: Tuple[Tuple[int, int]],
-        data: defaultdict,
+        data: BitBoard,
     ) -> bool:
         piece = data[target[0]]
         return (
@@ -661,7 +940,7 @@ class CastlingActionRule(ActionRule):
             and piece[0] == color
             and piece[1] == Name.KING
             # No castling in case of separation
-            and piece[2] == 1
+            and piece[2] == ONE
         )
 
     @classmethod
@@ -672,7 +951,7 @@ class CastlingActionRule(ActionRule):
         source: Tuple[Tuple[int, int]],
         target: Tuple[Tuple[int, int]],
         pieces: list,
-    ) -> str:
+    ) -> Tuple[str, Set[Tuple[int, int]]]:
         # Long castling.
         if source[0][0] == 1:
             rook, king = 4, 3
@@ -682,6 +961,9 @@ class CastlingActionRule(ActionRule):
             rook, king = 6, 7
             record = "0-0"
 
+        row = source[0][1]
+        places = {source[0], target[0], (rook, row), (king, row)}
+
         # Rook moves to new place.
         piece = cls.find(source[0], pieces)
         probability = piece.remove(source[0])[2]
@@ -692,7 +974,7 @@ class CastlingActionRule(ActionRule):
         probability = piece.remove(target[0])[2]
         piece.add((king, target[0][1], probability))
 
-        return record
+        return record, places
 
 
 class MeetActionRule(ActionRule):
@@ -705,6 +987,9 @@ class MeetActionRule(ActionRule):
 
     """
 
+    shape = (1, 1)
+    occupancy = (Occupancy.OWN,)
+
     @classmethod
     def condition(
         cls,
@@ -712,7 +997,7 @@ class MeetActionRule(ActionRule):
         name: Name,
         source: Tuple[Tuple[int, int]],
         target: Tuple[Tuple[int, int]],
-        data: defaultdict,
+        data: BitBoard,
     ) -> bool:
         piece = data[target[0]]
         return (
@@ -723,7 +1008,7 @@ class MeetActionRule(ActionRule):
             and piece
             and piece[0] == color
             # It's not castling.
-            and (piece[2] < 1 or piece[1] != Name.KING)
+            and (piece[2] < ONE or piece[1] != Name.KING)
         )
 
     @classmethod
@@ -734,9 +1019,10 @@ class MeetActionRule(ActionRule):
         source: Tuple[Tuple[int, int]],
         target: Tuple[Tuple[int, int]],
         pieces: list,
-    ) -> str:
+    ) -> Tuple[str, Set[Tuple[int, int]]]:
         src_piece = cls.find(source[0], pieces)
         dst_piece = cls.find(target[0], pieces)
+        places = cls.places(src_piece, dst_piece)
 
         record = "-".join([cls.place2str(source[0]), cls.place2str(target[0])])
         record = cls.piece2str(src_piece) + record
@@ -747,28 +1033,31 @@ class MeetActionRule(ActionRule):
             probability2 = dst_piece.remove(target[0])[2]
             src_piece.add((*target[0], probability1))
             dst_piece.add((*source[0], probability2))
-            return record
+            return record, places
 
-        dst_place = dst_piece.measure()
+        dst_place = dst_piece.measure(cls.rng(pieces))
         # In non superposition state
         if not src_piece.superposed():
             if dst_place != target[0]:
                 src_piece.clear()
-                src_piece.add((*target[0], 1))
+                src_piece.add((*target[0], ONE))
         # In superposition state
         else:
-            src_place = src_piece.measure()
+            src_place = src_piece.measure(cls.rng(pieces))
             # Target place is empty
             if dst_place != target[0] and src_place == source[0]:
                 src_piece.clear()
-                src_piece.add((*target[0], 1))
+                src_piece.add((*target[0], ONE))
 
-        return record
+        return record, places
 
 
 class SplitMoveActionRule(ActionRule):
     """Action rule for split movement."""
 
+    shape = (1, 2)
+    occupancy = None
+
     @classmethod
     def condition(
         cls,
@@ -776,7 +1065,7 @@ class SplitMoveActionRule(ActionRule):
         name: Name,
         source: Tuple[Tuple[int, int]],
         target: Tuple[Tuple[int, int]],
-        data: defaultdict,
+        data: BitBoard,
     ) -> bool:
         # There are two targets for split movement.
         return len(target) == 2
@@ -789,10 +1078,11 @@ class SplitMoveActionRule(ActionRule):
         source: Tuple[Tuple[int, int]],
         target: Tuple[Tuple[int, int]],
         pieces: list,
-    ) -> str:
+    ) -> Tuple[str, Set[Tuple[int, int]]]:
         dst_piece0 = cls.find(target[0], pieces)
         dst_piece1 = cls.find(target[1], pieces)
         src_piece = cls.find(source[0], pieces)
+        places = cls.places(src_piece, dst_piece0, dst_piece1) | set(target)
 
         # In the record, two targets are connected through `^`
         record = f"{cls.piece2str(src_piece)}{cls.place2str(source[0])}-{cls.place2str(target[0])}^{cls.place2str(target[1])}"
@@ -807,7 +1097,7 @@ class SplitMoveActionRule(ActionRule):
             dst_piece0.add((*target[1], probability2))
             dst_piece1.add((*source[0], probability3))
 
-            return record
+            return record, places
 
         # If there are chess pieces at the target, the probability is exchanged.
         if dst_piece0:
@@ -818,15 +1108,18 @@ class SplitMoveActionRule(ActionRule):
         # Split into two pieces,
         # and the probability of each piece is half of the original.
         probability = src_piece.remove(source[0])[2]
-        src_piece.add((*target[0], probability / 2))
-        src_piece.add((*target[1], probability / 2))
+        src_piece.add((*target[0], probability >> 1))
+        src_piece.add((*target[1], probability >> 1))
 
-        return record
+        return record, places
 
 
 class MergeMoveActionRule(ActionRule):
     """Action rule for merge movement."""
 
+    shape = (2, 1)
+    occupancy = None
+
     @classmethod
     def condition(
         cls,
@@ -834,7 +1127,7 @@ class MergeMoveActionRule(ActionRule):
         name: Name,
         source: Tuple[Tuple[int, int]],
         target: Tuple[Tuple[int, int]],
-        data: defaultdict,
+        data: BitBoard,
     ) -> bool:
         # There are two sources for merge movement.
         return len(source) == 2
@@ -847,7 +1140,7 @@ class MergeMoveActionRule(ActionRule):
         source: Tuple[Tuple[int, int]],
         target: Tuple[Tuple[int, int]],
         pieces: list,
-    ) -> str:
+    ) -> Tuple[str, Set[Tuple[int, int]]]:
         src_piece = cls.find(source[0], pieces)
 
         # In the record, two sources are connected through `^`
@@ -858,4 +1151,4 @@ class MergeMoveActionRule(ActionRule):
         # the probabilities of the original two pieces.
         probability = src_piece.remove(source[0])[2] + src_piece.remove(source[1])[2]
         src_piece.add((*target[0], probability))
-        return record
+        return record, cls.places(src_piece) | set(source)
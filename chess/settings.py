@@ -62,6 +62,16 @@ default_setting = {
     },
     # Database file name.
     "database": "sqlite.db",
+    # The maximum number of positions whose actions are cached (0 to disable).
+    "action_cache_size": 4096,
+    # Draw rules: the number of times the same position appears,
+    # and the number of moves of each side without any capture (0 to disable).
+    "draw": {"repetition": 3, "no_capture": 50},
+    # Limits of the places of a piece after each action:
+    # the maximum number of places (0 for no limit),
+    # and the probability below which a place is folded into the others.
+    # Folding changes the measurements, so both are off by default.
+    "superposition": {"width": 0, "floor": 0},
 }
 
 
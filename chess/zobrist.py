@@ -0,0 +1,74 @@
+# Author       : czy
+# Description  : Zobrist hashing of quantum chess positions.
+#
+# Copyright 2022 Zhiyuan Chen <chenzhiyuan@mail.ustc.edu.cn>
+
+import random
+from typing import Optional, Sequence
+
+from chess.constant import Color, Name
+
+MASK = (1 << 64) - 1
+
+# A private generator, so that the global random state
+# (used to measure the pieces) is not disturbed.
+_random = random.Random(20220101)
+
+# TABLE[square][color.value][name.value]
+TABLE = [
+    [[_random.getrandbits(64) for _ in Name] for _ in Color] for _ in range(64)
+]
+# Keys of the piece indices, used to tell which places belong to the same piece.
+SLOTS = [_random.getrandbits(64) for _ in range(64)]
+# Key of the side to move, only used when it is black's turn.
+SIDE = _random.getrandbits(64)
+# Keys of the moving rules of pieces whose rule is not that of their name.
+KINDS = [_random.getrandbits(64) for _ in Name]
+
+
+def mix(key: int) -> int:
+    """Scramble a 64-bit integer (the finalizer of SplitMix64)."""
+    key = ((key ^ (key >> 30)) * 0xBF58476D1CE4E5B9) & MASK
+    key = ((key ^ (key >> 27)) * 0x94D049BB133111EB) & MASK
+    return key ^ (key >> 31)
+
+
+def place_key(color: Color, name: Name, sq: int, probability: int) -> int:
+    """
+    Get the key of a piece appearing on a square with some probability.
+    The probability is fixed-point, so it is hashed exactly.
+    """
+    return mix((TABLE[sq][color.value][name.value] + probability) & MASK)
+
+
+def piece_key(
+    color: Color,
+    name: Name,
+    squares: Sequence[int],
+    probabilities: Sequence[int],
+    slot: int,
+    kind: Optional[Name] = None,
+) -> int:
+    """
+    Get the key of a piece.
+
+    Notes
+    -----
+    The key of a piece in one place is the key of that place,
+    so the same position reached by different pieces has the same key.
+    The places of a superposed piece are additionally bound together
+    by the index of the piece, otherwise one piece in two places
+    could not be distinguished from two pieces in one place each.
+    A piece that moves by the rule of another name `kind`
+    (a promoted pawn, see `Piece.kind`) is told apart by that name.
+
+    """
+    key = 0
+    for sq, probability in zip(squares, probabilities):
+        key ^= place_key(color, name, sq, probability)
+    if kind is not None and kind != name:
+        key ^= KINDS[kind.value]
+
+    if len(squares) > 1:
+        key = mix(key ^ SLOTS[slot % 64])
+    return key